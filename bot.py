@@ -5,11 +5,18 @@ Main entry point with Mini App integration.
 import asyncio
 import logging
 import os
+import re
+
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:  # pragma: no cover — optional speedup, not available on Windows
+    uvloop = None
 
 from fastapi import Request
 from telegram import Update
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler,
+    AIORateLimiter, Application, CommandHandler, MessageHandler,
     CallbackQueryHandler, filters
 )
 import uvicorn
@@ -48,29 +55,63 @@ async def text_router(update, context):
     await handle_text(update, context)
 
 
+# Single callback-query entry point: PTB tests each registered handler's
+# pattern per update, so one compiled regex + a prefix dict beats five
+# separate CallbackQueryHandler registrations.
+_CALLBACK_ROUTES = {
+    "rem": handle_reminder_callback,
+    "tz": tz_callback,
+    "settings": settings_callback,
+    "snooze_week": handle_snooze_week,
+    "done": handle_callback,
+    "snooze30": handle_callback,
+    "snooze60": handle_callback,
+    "tomorrow": handle_callback,
+    "skip": handle_callback,
+    "cancel": handle_callback,
+}
+
+_CALLBACK_PATTERN = re.compile(r"^(" + "|".join(_CALLBACK_ROUTES) + r"):")
+
+# Command registration table — handlers bound at import time
+COMMANDS = (
+    ("oggi", cmd_oggi), ("domani", cmd_domani), ("settimana", cmd_settimana),
+    ("lista", cmd_lista), ("farmaci", cmd_farmaci), ("scadenze", cmd_scadenze),
+    ("fatto", cmd_fatto), ("cancella", cmd_cancella), ("silenzio", cmd_silenzio),
+    ("timezone", cmd_timezone), ("impostazioni", cmd_impostazioni),
+    ("export", cmd_export), ("help", cmd_help),
+)
+
+
+async def root_callback(update, context):
+    """Dispatch callback queries by their data prefix."""
+    prefix = update.callback_query.data.split(":", 1)[0]
+    handler = _CALLBACK_ROUTES.get(prefix)
+    if handler:
+        await handler(update, context)
+
+
 def main():
     """Start the bot with Mini App API."""
-    app = Application.builder().token(BOT_TOKEN).build()
+    # Token-bucket rate limiter: bursts (many users tapping at once) queue
+    # just under Telegram's 30 msg/s bot-wide cap instead of erroring, and
+    # flood-control RetryAfter responses are retried automatically.
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .rate_limiter(AIORateLimiter(overall_max_rate=29, max_retries=3))
+        .build()
+    )
 
     # --- Handlers ---
     app.add_handler(get_onboarding_handler(), group=0)
 
     # Commands
-    for cmd, handler in [
-        ("oggi", cmd_oggi), ("domani", cmd_domani), ("settimana", cmd_settimana),
-        ("lista", cmd_lista), ("farmaci", cmd_farmaci), ("scadenze", cmd_scadenze),
-        ("fatto", cmd_fatto), ("cancella", cmd_cancella), ("silenzio", cmd_silenzio),
-        ("timezone", cmd_timezone), ("impostazioni", cmd_impostazioni),
-        ("export", cmd_export), ("help", cmd_help),
-    ]:
+    for cmd, handler in COMMANDS:
         app.add_handler(CommandHandler(cmd, handler), group=1)
 
-    # Callbacks
-    app.add_handler(CallbackQueryHandler(handle_reminder_callback, pattern=r"^rem:"), group=1)
-    app.add_handler(CallbackQueryHandler(tz_callback, pattern=r"^tz:"), group=1)
-    app.add_handler(CallbackQueryHandler(settings_callback, pattern=r"^settings:"), group=1)
-    app.add_handler(CallbackQueryHandler(handle_snooze_week, pattern=r"^snooze_week:"), group=1)
-    app.add_handler(CallbackQueryHandler(handle_callback, pattern=r"^(done|snooze30|snooze60|tomorrow|skip|cancel):"), group=1)
+    # Callbacks — one handler, prefix dispatch in root_callback
+    app.add_handler(CallbackQueryHandler(root_callback, pattern=_CALLBACK_PATTERN), group=1)
 
     # Voice & Text
     app.add_handler(MessageHandler(filters.VOICE, handle_voice), group=2)
@@ -81,10 +122,19 @@ def main():
         await init_db()
         init_scheduler(application.bot)
         await setup_webapp_button(application)
+        # Fire-and-forget: prime the Groq TLS connection in the background
+        from services.llm import warmup_http_client
+        asyncio.create_task(warmup_http_client())
         logger.info("Database + Scheduler + WebApp button initialized")
 
     app.post_init = post_init
 
+    async def post_shutdown(application):
+        from services.llm import close_http_client
+        await close_http_client()
+
+    app.post_shutdown = post_shutdown
+
     # --- Start ---
     if WEBHOOK_URL:
         # Combined mode: FastAPI serves API + Telegram webhook
@@ -1,29 +1,85 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
 from sqlalchemy import (
     BigInteger, Boolean, Column, DateTime, Enum, Float,
-    ForeignKey, Integer, String, Text, create_engine
+    ForeignKey, Index, Integer, String, Text, create_engine, text
 )
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import DeclarativeBase, relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import enum
+import os
 
 from config import DATABASE_URL
 
 
 # --- Engine setup ---
 
-def _get_async_url(url: str) -> str:
-    """Convert postgres:// or postgresql:// to postgresql+asyncpg://"""
+def _get_async_url(url: str) -> tuple[str, dict]:
+    """Convert postgres:// or postgresql:// to postgresql+asyncpg://.
+
+    Returns (url, connect_args): asyncpg doesn't understand libpq's
+    ?sslmode=..., so it's stripped from the URL and mapped to the
+    driver-level "ssl" connect arg.
+    """
     if url.startswith("postgres://"):
         url = url.replace("postgres://", "postgresql+asyncpg://", 1)
     elif url.startswith("postgresql://"):
         url = url.replace("postgresql://", "postgresql+asyncpg://", 1)
-    return url
 
-engine = create_async_engine(_get_async_url(DATABASE_URL), echo=False)
+    # Disable asyncpg's server-side JIT: it adds introspection latency on
+    # first use of each statement and buys nothing for our short queries.
+    connect_args = {"server_settings": {"jit": "off"}}
+
+    # Behind pgbouncer in transaction-pooling mode, asyncpg's prepared-
+    # statement cache breaks ("another operation is in progress"): a cached
+    # statement may land on a different server connection than the one that
+    # prepared it. Detect ?pgbouncer=true (or the env flag) and turn both
+    # caches off; this also bounds per-connection memory.
+    pgbouncer = os.environ.get("PGBOUNCER", "").lower() in ("1", "true", "yes")
+
+    parts = urlsplit(url)
+    if parts.query:
+        params = dict(parse_qsl(parts.query))
+        sslmode = params.pop("sslmode", None)
+        if sslmode is not None:
+            connect_args["ssl"] = sslmode not in ("disable", "allow", "prefer")
+        if params.pop("pgbouncer", "").lower() in ("1", "true", "yes"):
+            pgbouncer = True
+        url = urlunsplit(parts._replace(query=urlencode(params)))
+
+    if pgbouncer:
+        connect_args["statement_cache_size"] = 0
+        connect_args["prepared_statement_cache_size"] = 0
+
+    return url, connect_args
+
+_async_url, _connect_args = _get_async_url(DATABASE_URL)
+
+# Telegram updates arrive in bursts and every handler checks out a
+# connection, so size the pool well above SQLAlchemy's 5/10 defaults.
+# LIFO keeps the hottest connections in rotation; pre_ping + recycle
+# guard against the platform dropping idle connections.
+engine = create_async_engine(
+    _async_url,
+    echo=False,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=20,
+    max_overflow=40,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    pool_use_lifo=True,
+    connect_args=_connect_args,
+)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 
+def utcnow() -> datetime:
+    """Aware UTC now — single clock helper for columns and handlers."""
+    return datetime.now(timezone.utc)
+
+
 # --- Enums ---
 
 class ReminderCategory(str, enum.Enum):
@@ -51,6 +107,20 @@ class RecurrenceType(str, enum.Enum):
     CUSTOM = "custom"
 
 
+def _enum_column_type(enum_cls, name: str) -> Enum:
+    """Native Postgres ENUM storing the lowercase .value strings.
+
+    A pg enum is 4 bytes on disk vs ~15 bytes of text per value, so rows
+    and the status/category indexes shrink accordingly.
+    """
+    return Enum(
+        enum_cls,
+        name=name,
+        native_enum=True,
+        values_callable=lambda e: [m.value for m in e],
+    )
+
+
 # --- Models ---
 
 class Base(DeclarativeBase):
@@ -60,45 +130,72 @@ class Base(DeclarativeBase):
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(BigInteger, primary_key=True)  # Telegram user ID
-    chat_id = Column(BigInteger, nullable=False, unique=True)
+    # Telegram user ID. The bot only runs in private chats, where the chat
+    # id always equals the user id, so it doubles as the send target.
+    id = Column(BigInteger, primary_key=True)
     first_name = Column(String(255), nullable=True)
     timezone = Column(String(50), default="Europe/Rome")
     wake_hour = Column(Integer, default=8)
     sleep_hour = Column(Integer, default=23)
     morning_summary = Column(Boolean, default=True)
     onboarding_done = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # /silenzio: suppress nudges until this instant (NULL = not silenced)
+    silent_until = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=utcnow)
 
     reminders = relationship("Reminder", back_populates="user", cascade="all, delete-orphan")
 
 
 class Reminder(Base):
     __tablename__ = "reminders"
+    __table_args__ = (
+        # /lista, /oggi etc.: filter by user + status, order by next_fire
+        Index("ix_rem_user_status_nextfire", "user_id", "status", "next_fire"),
+        # scheduler ticks: due-reminder scan across all users
+        Index("ix_rem_nextfire_status", "next_fire", "status"),
+        # /fatto and quick-confirm: latest nudged reminder per user
+        Index("ix_rem_nudge_lookup", "user_id", "status", "nudge_count", "last_nudge_at"),
+        # every listing filters user + ACTIVE and orders by next_fire; a
+        # partial B-tree over just the active subset makes those direct
+        # pre-sorted range scans and skips done/cancelled rows entirely
+        Index("ix_rem_active_user_fire", "user_id", "next_fire",
+              postgresql_where=text("status = 'active'")),
+        # check_reminders polls every 30s for active, not-yet-nudged rows
+        # due now; this partial index makes that a seek over exactly the
+        # matching subset instead of a scan of all active reminders
+        Index("ix_rem_due_scan", "next_fire",
+              postgresql_where=text("status = 'active' AND nudge_count = 0")),
+        # check_nudges: active rows mid-nudge, filtered by last_nudge_at
+        Index("ix_rem_nudge_scan", "last_nudge_at",
+              postgresql_where=text("status = 'active' AND nudge_count >= 1")),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     title = Column(String(500), nullable=False)
-    category = Column(String(50), default=ReminderCategory.GENERIC)
+    category = Column(_enum_column_type(ReminderCategory, "reminder_category"),
+                      default=ReminderCategory.GENERIC)
 
     # Scheduling
-    next_fire = Column(DateTime, nullable=False)  # UTC
-    recurrence = Column(String(50), default=RecurrenceType.ONCE)
+    next_fire = Column(DateTime(timezone=True), nullable=False)  # UTC
+    recurrence = Column(_enum_column_type(RecurrenceType, "recurrence_type"),
+                        default=RecurrenceType.ONCE)
     recurrence_days = Column(String(50), nullable=True)  # e.g. "mon,wed,fri"
-    fire_times = Column(Text, nullable=True)  # e.g. "08:00,14:00,21:00" for multi-time
-    end_date = Column(DateTime, nullable=True)  # NULL = no end
+    fire_times = Column(ARRAY(String(5)), nullable=True)  # e.g. ["08:00", "14:00", "21:00"] for multi-time
+    end_date = Column(DateTime(timezone=True), nullable=True)  # NULL = no end
 
     # Advance notice (days before)
     advance_days = Column(Integer, default=0)
 
     # Nudge tracking
     nudge_count = Column(Integer, default=0)
-    last_nudge_at = Column(DateTime, nullable=True)
+    last_nudge_at = Column(DateTime(timezone=True), nullable=True)
 
     # Status
-    status = Column(String(50), default=ReminderStatus.ACTIVE)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    completed_at = Column(DateTime, nullable=True)
+    status = Column(_enum_column_type(ReminderStatus, "reminder_status"),
+                    default=ReminderStatus.ACTIVE)
+    created_at = Column(DateTime(timezone=True), default=utcnow)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
 
     # For multi-time reminders (medicine), track which time slot this is
     time_slot_index = Column(Integer, nullable=True)  # 0, 1, 2...
@@ -114,12 +211,17 @@ class Reminder(Base):
 class ReminderLog(Base):
     """Tracks actions on reminders for weekly summary."""
     __tablename__ = "reminder_logs"
+    __table_args__ = (
+        # weekly summary: logs per user in a time window
+        Index("ix_log_user_created", "user_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
-    reminder_id = Column(Integer, ForeignKey("reminders.id"), nullable=False)
+    # Postgres doesn't auto-index FK columns
+    reminder_id = Column(Integer, ForeignKey("reminders.id"), nullable=False, index=True)
     action = Column(String(50), nullable=False)  # done, skipped, snoozed, cancelled
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), default=utcnow)
 
 
 # --- Init ---
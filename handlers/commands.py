@@ -2,20 +2,24 @@
 Handlers for utility commands: /oggi, /domani, /settimana, /lista, /farmaci,
 /scadenze, /fatto, /cancella, /silenzio, /export, /help, /impostazioni, /timezone.
 """
+import io
 import json
+import re
 import logging
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from sqlalchemy import select, and_
-import pytz
+from sqlalchemy import bindparam, select, and_
+from sqlalchemy import update as sa_update
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from database import (
-    async_session, Reminder, User, ReminderLog,
+    async_session, utcnow, Reminder, User, ReminderLog,
     ReminderStatus, ReminderCategory, RecurrenceType
 )
 from services.messages import get_emoji, HELP_TEXT
-from services.scheduler import reschedule_reminder
+from services.scheduler import complete_latest_nudged, reschedule_reminder
 from handlers.start import get_persistent_keyboard
 
 logger = logging.getLogger(__name__)
@@ -24,11 +28,25 @@ logger = logging.getLogger(__name__)
 KB = get_persistent_keyboard()
 
 
-async def _get_user_tz(user_id: int) -> pytz.timezone:
+# Timezones change almost never but are read on every list command, so a
+# short per-process TTL cache spares the SELECT. Writes (cmd_timezone,
+# tz_callback) pop the entry so the next read sees the new value.
+_TZ_CACHE: dict[int, tuple[float, ZoneInfo]] = {}
+_TZ_CACHE_TTL = 300.0
+
+
+async def _get_user_tz(user_id: int) -> ZoneInfo:
+    now = time.monotonic()
+    cached = _TZ_CACHE.get(user_id)
+    if cached and now - cached[0] < _TZ_CACHE_TTL:
+        return cached[1]
+
     async with async_session() as session:
         user = await session.get(User, user_id)
         tz_name = user.timezone if user else "Europe/Rome"
-    return pytz.timezone(tz_name)
+    tz = ZoneInfo(tz_name)
+    _TZ_CACHE[user_id] = (now, tz)
+    return tz
 
 
 async def _get_reminders_in_range(user_id: int, start_utc: datetime, end_utc: datetime):
@@ -45,107 +63,120 @@ async def _get_reminders_in_range(user_id: int, start_utc: datetime, end_utc: da
         return result.scalars().all()
 
 
-def _format_reminder_line(r: Reminder, tz) -> str:
+def _format_reminder_line(r, fire_local: datetime) -> str:
+    """Render one list row. Takes the already-converted local fire time so
+    callers that need it for grouping don't convert twice.
+
+    Works on a full Reminder or a projected Row — both expose the title,
+    category, fire_times and time_slot_index attributes read here."""
     emoji = get_emoji(r.category)
-    fire_local = pytz.UTC.localize(r.next_fire).astimezone(tz)
     time_str = fire_local.strftime("%H:%M")
 
     if r.fire_times and r.time_slot_index == 0:
-        times = r.fire_times.split(",")
-        return f"{emoji} {r.title} _({' · '.join(times)})_"
+        return f"{emoji} {r.title} _({' · '.join(r.fire_times)})_"
     elif r.fire_times and r.time_slot_index and r.time_slot_index > 0:
         return None  # Skip duplicate time slots
     return f"{emoji} {r.title} _({time_str})_"
 
 
-# --- /oggi ---
-async def cmd_oggi(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    tz = await _get_user_tz(update.effective_user.id)
-    now = datetime.now(tz)
-    start = now.replace(hour=0, minute=0, second=0).astimezone(pytz.UTC).replace(tzinfo=None)
-    end = start + timedelta(days=1)
+# Static UI pieces built once at import: InlineKeyboardMarkup objects are
+# immutable, so there is no reason to reassemble them per command.
+_DAY_NAMES = ("Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato", "Domenica")
 
-    reminders = await _get_reminders_in_range(update.effective_user.id, start, end)
+_TZ_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🇮🇹 Italia", callback_data="tz:Europe/Rome")],
+    [InlineKeyboardButton("🇬🇧 UK", callback_data="tz:Europe/London")],
+    [InlineKeyboardButton("🇺🇸 EST", callback_data="tz:US/Eastern")],
+    [InlineKeyboardButton("🇺🇸 PST", callback_data="tz:US/Pacific")],
+])
 
-    if not reminders:
-        await update.message.reply_text("📋 Oggi non hai nulla in programma!", reply_markup=KB)
-        return
+_SETTINGS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton(
+        "☀️ Buongiorno ON/OFF",
+        callback_data="settings:toggle_morning"
+    )],
+])
 
-    lines = ["📋 *Oggi:*\n"]
-    for r in reminders:
-        line = _format_reminder_line(r, tz)
-        if line:
-            lines.append(line)
-
-    await update.message.reply_text("\n".join(lines), parse_mode="Markdown", reply_markup=KB)
-
-
-# --- /domani ---
-async def cmd_domani(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    tz = await _get_user_tz(update.effective_user.id)
-    now = datetime.now(tz)
-    start = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0).astimezone(pytz.UTC).replace(tzinfo=None)
-    end = start + timedelta(days=1)
-
-    reminders = await _get_reminders_in_range(update.effective_user.id, start, end)
-
-    if not reminders:
-        await update.message.reply_text("📋 Domani non hai nulla in programma!", reply_markup=KB)
-        return
+_SILENZIO_USAGE = (
+    "Usa: /silenzio 2h oppure /silenzio 30m\n"
+    "Es: `/silenzio 2h`"
+)
 
-    lines = ["📋 *Domani:*\n"]
-    for r in reminders:
-        line = _format_reminder_line(r, tz)
-        if line:
-            lines.append(line)
+# "2h" / "30m" / bare minutes in one pass, with a clean error path
+# instead of int() raising on malformed input.
+_SILENZIO_RE = re.compile(r"^(\d+)\s*([hm]?)$")
 
-    await update.message.reply_text("\n".join(lines), parse_mode="Markdown", reply_markup=KB)
 
+async def _render_range(update: Update, offset_days: int, span_days: int,
+                        header: str, empty_text: str, group_by_day: bool = False):
+    """Shared renderer for /oggi, /domani and /settimana.
 
-# --- /settimana ---
-async def cmd_settimana(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    One tz lookup, one range query and one formatting loop serve all
+    three commands; they differ only in window and grouping.
+    """
     tz = await _get_user_tz(update.effective_user.id)
     now = datetime.now(tz)
-    start = now.replace(hour=0, minute=0, second=0).astimezone(pytz.UTC).replace(tzinfo=None)
-    end = start + timedelta(days=7)
+    start = (now + timedelta(days=offset_days)).replace(hour=0, minute=0, second=0).astimezone(timezone.utc)
+    end = start + timedelta(days=span_days)
 
     reminders = await _get_reminders_in_range(update.effective_user.id, start, end)
 
     if not reminders:
-        await update.message.reply_text("📋 Nessun reminder nei prossimi 7 giorni!", reply_markup=KB)
+        await update.message.reply_text(empty_text, reply_markup=KB)
         return
 
-    lines = ["📋 *Prossimi 7 giorni:*\n"]
+    lines = [header]
     current_day = None
-    day_names = ["Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato", "Domenica"]
 
     for r in reminders:
-        fire_local = pytz.UTC.localize(r.next_fire).astimezone(tz)
-        day_key = fire_local.strftime("%Y-%m-%d")
+        # One tz conversion per row, shared between grouping and the line;
+        # a date object is a cheaper day key than a strftime string.
+        fire_local = r.next_fire.astimezone(tz)
 
-        if day_key != current_day:
-            current_day = day_key
-            day_name = day_names[fire_local.weekday()]
+        if group_by_day and fire_local.date() != current_day:
+            current_day = fire_local.date()
+            day_name = _DAY_NAMES[fire_local.weekday()]
             lines.append(f"\n*{day_name} {fire_local.strftime('%d/%m')}*")
 
-        line = _format_reminder_line(r, tz)
+        line = _format_reminder_line(r, fire_local)
         if line:
-            lines.append(f"  {line}")
+            lines.append(f"  {line}" if group_by_day else line)
 
     await update.message.reply_text("\n".join(lines), parse_mode="Markdown", reply_markup=KB)
 
 
+# --- /oggi ---
+async def cmd_oggi(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _render_range(update, 0, 1, "📋 *Oggi:*\n", "📋 Oggi non hai nulla in programma!")
+
+
+# --- /domani ---
+async def cmd_domani(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _render_range(update, 1, 1, "📋 *Domani:*\n", "📋 Domani non hai nulla in programma!")
+
+
+# --- /settimana ---
+async def cmd_settimana(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _render_range(update, 0, 7, "📋 *Prossimi 7 giorni:*\n",
+                        "📋 Nessun reminder nei prossimi 7 giorni!", group_by_day=True)
+
+
 # --- /lista ---
 async def cmd_lista(update: Update, context: ContextTypes.DEFAULT_TYPE):
     async with async_session() as session:
-        stmt = select(Reminder).where(
+        # Narrow projection: plain Row tuples skip ORM identity-map and
+        # per-column instrumentation for rows we only read once.
+        stmt = select(
+            Reminder.title, Reminder.category, Reminder.next_fire,
+            Reminder.fire_times, Reminder.time_slot_index,
+        ).where(
             and_(
                 Reminder.user_id == update.effective_user.id,
                 Reminder.status == ReminderStatus.ACTIVE,
             )
         ).order_by(Reminder.next_fire)
         result = await session.execute(stmt)
-        reminders = result.scalars().all()
+        reminders = result.all()
 
     if not reminders:
         await update.message.reply_text("📋 Non hai reminder attivi.", reply_markup=KB)
@@ -154,7 +185,7 @@ async def cmd_lista(update: Update, context: ContextTypes.DEFAULT_TYPE):
     tz = await _get_user_tz(update.effective_user.id)
     lines = ["📋 *Tutti i reminder attivi:*\n"]
     for r in reminders:
-        line = _format_reminder_line(r, tz)
+        line = _format_reminder_line(r, r.next_fire.astimezone(tz))
         if line:
             lines.append(line)
 
@@ -164,7 +195,7 @@ async def cmd_lista(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # --- /farmaci ---
 async def cmd_farmaci(update: Update, context: ContextTypes.DEFAULT_TYPE):
     async with async_session() as session:
-        stmt = select(Reminder).where(
+        stmt = select(Reminder.title, Reminder.fire_times, Reminder.end_date).where(
             and_(
                 Reminder.user_id == update.effective_user.id,
                 Reminder.status == ReminderStatus.ACTIVE,
@@ -173,7 +204,7 @@ async def cmd_farmaci(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         ).order_by(Reminder.next_fire)
         result = await session.execute(stmt)
-        reminders = result.scalars().all()
+        reminders = result.all()
 
     if not reminders:
         await update.message.reply_text("💊 Nessun farmaco configurato.\n\nScrivimi il nome di un farmaco per aggiungerlo!", reply_markup=KB)
@@ -182,33 +213,41 @@ async def cmd_farmaci(update: Update, context: ContextTypes.DEFAULT_TYPE):
     tz = await _get_user_tz(update.effective_user.id)
     lines = ["💊 *Farmaci attivi:*\n"]
     for r in reminders:
-        times_str = r.fire_times or ""
+        times_str = " · ".join(r.fire_times or [])
         end_str = ""
         if r.end_date:
-            end_local = pytz.UTC.localize(r.end_date).astimezone(tz)
+            end_local = r.end_date.astimezone(tz)
             end_str = f" — fino al {end_local.strftime('%d/%m')}"
         lines.append(f"💊 *{r.title}*")
-        lines.append(f"   ⏰ {times_str.replace(',', ' · ')}{end_str}")
+        lines.append(f"   ⏰ {times_str}{end_str}")
 
     await update.message.reply_text("\n".join(lines), parse_mode="Markdown", reply_markup=KB)
 
 
 # --- /scadenze ---
+# Statement and category list built once at import: only the user id and
+# the (stable) category tuple are bound per call, so SQLAlchemy reuses
+# the compiled SQL instead of rebuilding the expression tree per request.
+_DEADLINE_VALUES = tuple(c.value for c in (
+    ReminderCategory.CAR, ReminderCategory.DOCUMENT,
+    ReminderCategory.HOUSE, ReminderCategory.HEALTH,
+))
+_SCADENZE_STMT = select(Reminder.title, Reminder.category, Reminder.next_fire).where(
+    and_(
+        Reminder.user_id == bindparam("uid"),
+        Reminder.status == ReminderStatus.ACTIVE,
+        Reminder.category.in_(bindparam("cats", expanding=True)),
+    )
+).order_by(Reminder.next_fire)
+
+
 async def cmd_scadenze(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    deadline_cats = [
-        ReminderCategory.CAR, ReminderCategory.DOCUMENT,
-        ReminderCategory.HOUSE, ReminderCategory.HEALTH,
-    ]
     async with async_session() as session:
-        stmt = select(Reminder).where(
-            and_(
-                Reminder.user_id == update.effective_user.id,
-                Reminder.status == ReminderStatus.ACTIVE,
-                Reminder.category.in_([c.value for c in deadline_cats]),
-            )
-        ).order_by(Reminder.next_fire)
-        result = await session.execute(stmt)
-        reminders = result.scalars().all()
+        result = await session.execute(
+            _SCADENZE_STMT,
+            {"uid": update.effective_user.id, "cats": _DEADLINE_VALUES},
+        )
+        reminders = result.all()
 
     if not reminders:
         await update.message.reply_text("📄 Nessuna scadenza impostata.", reply_markup=KB)
@@ -218,7 +257,7 @@ async def cmd_scadenze(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lines = ["📄 *Scadenze:*\n"]
     for r in reminders:
         emoji = get_emoji(r.category)
-        fire_local = pytz.UTC.localize(r.next_fire).astimezone(tz)
+        fire_local = r.next_fire.astimezone(tz)
         lines.append(f"{emoji} *{r.title}* — {fire_local.strftime('%d/%m/%Y')}")
 
     await update.message.reply_text("\n".join(lines), parse_mode="Markdown", reply_markup=KB)
@@ -227,24 +266,11 @@ async def cmd_scadenze(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # --- /fatto ---
 async def cmd_fatto(update: Update, context: ContextTypes.DEFAULT_TYPE):
     async with async_session() as session:
-        stmt = select(Reminder).where(
-            and_(
-                Reminder.user_id == update.effective_user.id,
-                Reminder.status == ReminderStatus.ACTIVE,
-                Reminder.nudge_count > 0,
-            )
-        ).order_by(Reminder.last_nudge_at.desc()).limit(1)
-        result = await session.execute(stmt)
-        reminder = result.scalar_one_or_none()
-
-        if not reminder:
-            await update.message.reply_text("Non hai reminder attivi da completare.", reply_markup=KB)
-            return
+        reminder = await complete_latest_nudged(session, update.effective_user.id)
 
-        log = ReminderLog(user_id=reminder.user_id, reminder_id=reminder.id, action="done")
-        session.add(log)
-        await reschedule_reminder(reminder, session)
-        await session.commit()
+    if not reminder:
+        await update.message.reply_text("Non hai reminder attivi da completare.", reply_markup=KB)
+        return
 
     await update.message.reply_text(f"✅ *{reminder.title}* completato!", parse_mode="Markdown", reply_markup=KB)
 
@@ -252,14 +278,14 @@ async def cmd_fatto(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # --- /cancella ---
 async def cmd_cancella(update: Update, context: ContextTypes.DEFAULT_TYPE):
     async with async_session() as session:
-        stmt = select(Reminder).where(
+        stmt = select(Reminder.id, Reminder.title, Reminder.category).where(
             and_(
                 Reminder.user_id == update.effective_user.id,
                 Reminder.status == ReminderStatus.ACTIVE,
             )
         ).order_by(Reminder.next_fire).limit(10)
         result = await session.execute(stmt)
-        reminders = result.scalars().all()
+        reminders = result.all()
 
     if not reminders:
         await update.message.reply_text("Non hai reminder da cancellare.", reply_markup=KB)
@@ -282,25 +308,24 @@ async def cmd_cancella(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_silenzio(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if not args:
-        await update.message.reply_text(
-            "Usa: /silenzio 2h oppure /silenzio 30m\n"
-            "Es: `/silenzio 2h`",
-            parse_mode="Markdown",
-            reply_markup=KB
-        )
+        await update.message.reply_text(_SILENZIO_USAGE, parse_mode="Markdown", reply_markup=KB)
         return
 
-    text = args[0].lower()
-    minutes = 0
-    if text.endswith("h"):
-        minutes = int(text[:-1]) * 60
-    elif text.endswith("m"):
-        minutes = int(text[:-1])
-    else:
-        minutes = int(text)
+    m = _SILENZIO_RE.match(args[0].lower())
+    if not m:
+        await update.message.reply_text(_SILENZIO_USAGE, parse_mode="Markdown", reply_markup=KB)
+        return
+    minutes = int(m.group(1)) * (60 if m.group(2) == "h" else 1)
 
-    # Store silence end time in user data (or DB)
-    context.user_data["silent_until"] = datetime.utcnow() + timedelta(minutes=minutes)
+    # Persist on the user row: the scheduler filters on it server-side,
+    # and it survives restarts unlike context.user_data.
+    async with async_session() as session:
+        await session.execute(
+            sa_update(User)
+            .where(User.id == update.effective_user.id)
+            .values(silent_until=utcnow() + timedelta(minutes=minutes))
+        )
+        await session.commit()
 
     label = f"{minutes // 60} ore" if minutes >= 60 else f"{minutes} minuti"
     await update.message.reply_text(f"🔇 Silenzio per {label}. Non ti disturbo!", reply_markup=KB)
@@ -310,22 +335,16 @@ async def cmd_silenzio(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     args = context.args
     if not args:
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🇮🇹 Italia", callback_data="tz:Europe/Rome")],
-            [InlineKeyboardButton("🇬🇧 UK", callback_data="tz:Europe/London")],
-            [InlineKeyboardButton("🇺🇸 EST", callback_data="tz:US/Eastern")],
-            [InlineKeyboardButton("🇺🇸 PST", callback_data="tz:US/Pacific")],
-        ])
         await update.message.reply_text(
             "🌍 Seleziona il tuo fuso orario:",
-            reply_markup=keyboard
+            reply_markup=_TZ_KEYBOARD
         )
         return
 
     tz_name = args[0]
     try:
-        pytz.timezone(tz_name)
-    except pytz.UnknownTimeZoneError:
+        ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
         await update.message.reply_text("⚠️ Fuso orario non valido. Prova ad es. Europe/Rome", reply_markup=KB)
         return
 
@@ -334,6 +353,7 @@ async def cmd_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if user:
             user.timezone = tz_name
             await session.commit()
+    _TZ_CACHE.pop(update.effective_user.id, None)
 
     await update.message.reply_text(f"✅ Fuso orario aggiornato: {tz_name}", reply_markup=KB)
 
@@ -350,6 +370,7 @@ async def tz_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if user:
             user.timezone = tz_name
             await session.commit()
+    _TZ_CACHE.pop(query.from_user.id, None)
 
     await query.edit_message_text(f"✅ Fuso orario aggiornato: {tz_name}")
 
@@ -372,13 +393,7 @@ async def cmd_impostazioni(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"☀️ Buongiorno: {morning}\n"
     )
 
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton(
-            "☀️ Buongiorno ON/OFF",
-            callback_data="settings:toggle_morning"
-        )],
-    ])
-    await update.message.reply_text(text, parse_mode="Markdown", reply_markup=keyboard)
+    await update.message.reply_text(text, parse_mode="Markdown", reply_markup=_SETTINGS_KEYBOARD)
 
 
 async def settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -398,38 +413,48 @@ async def settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # --- /export ---
 async def cmd_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Stream rows straight into the upload buffer: no materialized ORM
+    # list, no intermediate dict list, no full JSON string to re-encode.
+    # Peak memory goes from three copies of the export to one.
+    buf = io.BytesIO()
+    text_buf = io.TextIOWrapper(buf, encoding="utf-8", write_through=True)
+    count = 0
+
     async with async_session() as session:
-        stmt = select(Reminder).where(
+        stmt = select(
+            Reminder.title, Reminder.category, Reminder.next_fire,
+            Reminder.recurrence, Reminder.fire_times, Reminder.end_date,
+        ).where(
             and_(
                 Reminder.user_id == update.effective_user.id,
                 Reminder.status == ReminderStatus.ACTIVE,
             )
         ).order_by(Reminder.next_fire)
-        result = await session.execute(stmt)
-        reminders = result.scalars().all()
 
-    if not reminders:
+        text_buf.write("[\n")
+        async for r in await session.stream(stmt):
+            if count:
+                text_buf.write(",\n")
+            json.dump({
+                "title": r.title,
+                "category": r.category,
+                "next_fire": r.next_fire.isoformat() if r.next_fire else None,
+                "recurrence": r.recurrence,
+                "fire_times": r.fire_times,
+                "end_date": r.end_date.isoformat() if r.end_date else None,
+            }, text_buf, ensure_ascii=False, separators=(",", ":"))
+            count += 1
+        text_buf.write("\n]\n")
+
+    if not count:
         await update.message.reply_text("Non hai reminder da esportare.", reply_markup=KB)
         return
 
-    data = []
-    for r in reminders:
-        data.append({
-            "title": r.title,
-            "category": r.category,
-            "next_fire": r.next_fire.isoformat() if r.next_fire else None,
-            "recurrence": r.recurrence,
-            "fire_times": r.fire_times,
-            "end_date": r.end_date.isoformat() if r.end_date else None,
-        })
-
-    json_str = json.dumps(data, indent=2, ensure_ascii=False)
-
-    # Send as file
-    import io
-    buf = io.BytesIO(json_str.encode("utf-8"))
-    buf.name = "nudgebot_export.json"
-    await update.message.reply_document(buf, caption="📦 Ecco il tuo export!")
+    text_buf.detach()
+    buf.seek(0)
+    await update.message.reply_document(
+        buf, filename="nudgebot_export.json", caption="📦 Ecco il tuo export!"
+    )
 
 
 # --- /help ---
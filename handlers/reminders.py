@@ -3,35 +3,49 @@ Handles free-text messages, voice messages, and reminder callbacks.
 Routes everything through the assistant brain.
 """
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from sqlalchemy import select, and_
-import pytz
+from sqlalchemy import insert, select, and_
 
 from database import (
-    async_session, Reminder, ReminderLog, User,
+    async_session, utcnow, Reminder, ReminderLog, User,
     ReminderStatus, ReminderCategory, RecurrenceType
 )
 from services.parser import parse_reminder, format_confirmation, ParsedReminder
 from services.messages import done_response, get_emoji
-from services.scheduler import reschedule_reminder
+from services.scheduler import complete_latest_nudged, reschedule_reminder
+from handlers.commands import (
+    _get_user_tz, cmd_oggi, cmd_domani, cmd_settimana,
+    cmd_farmaci, cmd_impostazioni, cmd_help
+)
 
 logger = logging.getLogger(__name__)
 
 # Quick confirm keywords
-QUICK_CONFIRM = {"ok", "fatto", "sì", "si", "presa", "preso", "done", "✅"}
-
-# Persistent keyboard button mapping
-KEYBOARD_COMMANDS = {
-    "📋 Oggi": "oggi",
-    "📅 Domani": "domani",
-    "📊 Settimana": "settimana",
-    "💊 Farmaci": "farmaci",
-    "⚙️ Impostazioni": "impostazioni",
-    "❓ Help": "help",
+QUICK_CONFIRM = frozenset({"ok", "fatto", "sì", "si", "presa", "preso", "done", "✅"})
+
+# Persistent keyboard buttons straight to their handlers — bound once at
+# import so dispatch is a single dict lookup on the hot text path.
+_KB_DISPATCH = {
+    "📋 Oggi": cmd_oggi,
+    "📅 Domani": cmd_domani,
+    "📊 Settimana": cmd_settimana,
+    "💊 Farmaci": cmd_farmaci,
+    "⚙️ Impostazioni": cmd_impostazioni,
+    "❓ Help": cmd_help,
 }
 
+# Same confirm/edit/cancel keyboard on every new-reminder proposal;
+# Markup objects are immutable so one instance serves all users.
+_REMINDER_CONFIRM_KB = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("✅ Conferma", callback_data="rem:confirm"),
+        InlineKeyboardButton("✏️ Modifica ora", callback_data="rem:edit_time"),
+    ],
+    [InlineKeyboardButton("❌ Annulla", callback_data="rem:cancel")],
+])
+
 
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle voice messages: transcribe → process through assistant."""
@@ -82,21 +96,9 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.strip()
 
     # Check persistent keyboard buttons
-    if text in KEYBOARD_COMMANDS:
-        from handlers.commands import (
-            cmd_oggi, cmd_domani, cmd_settimana,
-            cmd_farmaci, cmd_impostazioni, cmd_help
-        )
-        cmd_map = {
-            "oggi": cmd_oggi,
-            "domani": cmd_domani,
-            "settimana": cmd_settimana,
-            "farmaci": cmd_farmaci,
-            "impostazioni": cmd_impostazioni,
-            "help": cmd_help,
-        }
-        cmd = KEYBOARD_COMMANDS[text]
-        await cmd_map[cmd](update, context)
+    handler = _KB_DISPATCH.get(text)
+    if handler:
+        await handler(update, context)
         return
 
     # Check quick confirm (skip LLM for these)
@@ -115,7 +117,6 @@ async def _process_with_assistant(update: Update, context: ContextTypes.DEFAULT_
     user = update.effective_user
     response = await process_message(
         user_id=user.id,
-        chat_id=update.effective_chat.id,
         text=text,
         first_name=user.first_name or "",
     )
@@ -125,15 +126,8 @@ async def _process_with_assistant(update: Update, context: ContextTypes.DEFAULT_
         # Store pending reminder for confirmation
         context.user_data["pending_reminder"] = response.pending_reminder
 
-        keyboard = InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("✅ Conferma", callback_data="rem:confirm"),
-                InlineKeyboardButton("✏️ Modifica ora", callback_data="rem:edit_time"),
-            ],
-            [InlineKeyboardButton("❌ Annulla", callback_data="rem:cancel")],
-        ])
         await update.message.reply_text(
-            response.text, parse_mode=response.parse_mode, reply_markup=keyboard
+            response.text, parse_mode=response.parse_mode, reply_markup=_REMINDER_CONFIRM_KB
         )
 
     elif response.confirm_delete_id:
@@ -196,112 +190,92 @@ async def handle_time_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Nessun reminder da modificare. Creane uno nuovo.")
         return True
 
-    # Re-parse just the time part
-    user_id = update.effective_user.id
-    async with async_session() as session:
-        user = await session.get(User, user_id)
-    tz_name = user.timezone if user else "Europe/Rome"
+    # Re-parse just the time part. The TTL-cached tz lookup spares the
+    # SELECT the assistant already paid for this user moments earlier.
+    tz = await _get_user_tz(update.effective_user.id)
 
-    time_parsed = parse_reminder(text, tz_name)
+    time_parsed = parse_reminder(text, tz.key)
 
     if time_parsed.fire_datetime:
-        pending["fire_datetime"] = time_parsed.fire_datetime.isoformat()
+        pending.fire_datetime = time_parsed.fire_datetime
         if time_parsed.fire_times:
-            pending["fire_times"] = time_parsed.fire_times
+            pending.fire_times = time_parsed.fire_times
 
     context.user_data["pending_reminder"] = pending
 
-    # Rebuild confirmation
-    p = ParsedReminder()
-    p.title = pending["title"]
-    try:
-        p.category = ReminderCategory(pending["category"])
-    except ValueError:
-        p.category = ReminderCategory.GENERIC
-    p.fire_datetime = datetime.fromisoformat(pending["fire_datetime"]) if pending["fire_datetime"] else None
-    try:
-        p.recurrence = RecurrenceType(pending["recurrence"])
-    except ValueError:
-        p.recurrence = RecurrenceType.ONCE
-    p.recurrence_days = pending.get("recurrence_days")
-    p.fire_times = pending.get("fire_times", [])
-
-    confirm_text = format_confirmation(p)
-
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("✅ Conferma", callback_data="rem:confirm"),
-            InlineKeyboardButton("✏️ Modifica ora", callback_data="rem:edit_time"),
-        ],
-        [InlineKeyboardButton("❌ Annulla", callback_data="rem:cancel")],
-    ])
-
-    await update.message.reply_text(confirm_text, parse_mode="Markdown", reply_markup=keyboard)
+    confirm_text = format_confirmation(pending)
+
+    await update.message.reply_text(confirm_text, parse_mode="Markdown", reply_markup=_REMINDER_CONFIRM_KB)
     return True
 
 
-async def _save_reminder(query, pending: dict):
+async def _save_reminder(query, pending: ParsedReminder):
     """Save confirmed reminder to database."""
     user_id = query.from_user.id
 
-    async with async_session() as session:
-        user = await session.get(User, user_id)
-        tz = pytz.timezone(user.timezone if user else "Europe/Rome")
+    # Cached tz lookup — no per-save SELECT on users just for the zone.
+    tz = await _get_user_tz(user_id)
 
-        fire_dt = datetime.fromisoformat(pending["fire_datetime"]) if pending.get("fire_datetime") else None
+    async with async_session() as session:
+        fire_dt = pending.fire_datetime
         if fire_dt:
             if fire_dt.tzinfo:
-                fire_utc = fire_dt.astimezone(pytz.UTC).replace(tzinfo=None)
+                fire_utc = fire_dt.astimezone(timezone.utc)
             else:
-                fire_utc = tz.localize(fire_dt).astimezone(pytz.UTC).replace(tzinfo=None)
+                fire_utc = fire_dt.replace(tzinfo=tz).astimezone(timezone.utc)
         else:
-            fire_utc = datetime.utcnow() + timedelta(hours=1)
+            fire_utc = utcnow() + timedelta(hours=1)
 
-        fire_times = pending.get("fire_times", [])
-        end_date = datetime.fromisoformat(pending["end_date"]) if pending.get("end_date") else None
+        fire_times = pending.fire_times
+        end_date = pending.end_date
         if end_date and end_date.tzinfo:
-            end_date = end_date.astimezone(pytz.UTC).replace(tzinfo=None)
+            end_date = end_date.astimezone(timezone.utc)
 
         if fire_times and len(fire_times) > 1:
+            # One executemany INSERT for all slots instead of N session.add
+            # flushes; "now" and the local base date are computed once since
+            # only hour/minute differ per slot.
+            base_local = datetime.now(tz).replace(second=0, microsecond=0)
+            now_utc = utcnow()
+            rows = []
             for idx, t in enumerate(fire_times):
                 h, m = map(int, t.split(":"))
-                local_fire = tz.localize(datetime.now(tz).replace(hour=h, minute=m, second=0))
-                slot_fire_utc = local_fire.astimezone(pytz.UTC).replace(tzinfo=None)
-                if slot_fire_utc < datetime.utcnow():
+                slot_fire_utc = base_local.replace(hour=h, minute=m).astimezone(timezone.utc)
+                if slot_fire_utc < now_utc:
                     slot_fire_utc += timedelta(days=1)
 
-                reminder = Reminder(
-                    user_id=user_id,
-                    title=pending["title"],
-                    category=pending.get("category", ReminderCategory.GENERIC),
-                    next_fire=slot_fire_utc,
-                    recurrence=pending.get("recurrence", RecurrenceType.DAILY),
-                    recurrence_days=pending.get("recurrence_days"),
-                    fire_times=",".join(fire_times),
-                    end_date=end_date,
-                    advance_days=pending.get("advance_days", 0),
-                    time_slot_index=idx,
-                    time_slot_total=len(fire_times),
-                )
-                session.add(reminder)
+                rows.append({
+                    "user_id": user_id,
+                    "title": pending.title,
+                    "category": pending.category,
+                    "next_fire": slot_fire_utc,
+                    "recurrence": pending.recurrence,
+                    "recurrence_days": pending.recurrence_days,
+                    "fire_times": fire_times,
+                    "end_date": end_date,
+                    "advance_days": pending.advance_days,
+                    "time_slot_index": idx,
+                    "time_slot_total": len(fire_times),
+                })
+            await session.execute(insert(Reminder), rows)
         else:
             reminder = Reminder(
                 user_id=user_id,
-                title=pending["title"],
-                category=pending.get("category", ReminderCategory.GENERIC),
+                title=pending.title,
+                category=pending.category,
                 next_fire=fire_utc,
-                recurrence=pending.get("recurrence", RecurrenceType.ONCE),
-                recurrence_days=pending.get("recurrence_days"),
-                fire_times=",".join(fire_times) if fire_times else None,
+                recurrence=pending.recurrence,
+                recurrence_days=pending.recurrence_days,
+                fire_times=fire_times or None,
                 end_date=end_date,
-                advance_days=pending.get("advance_days", 0),
+                advance_days=pending.advance_days,
             )
             session.add(reminder)
 
         await session.commit()
 
-    emoji = get_emoji(pending.get("category", "generic"))
-    await query.edit_message_text(f"{emoji} *{pending['title']}* — salvato! ✅", parse_mode="Markdown")
+    emoji = get_emoji(pending.category)
+    await query.edit_message_text(f"{emoji} *{pending.title}* — salvato! ✅", parse_mode="Markdown")
 
 
 async def _quick_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -309,27 +283,14 @@ async def _quick_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
     async with async_session() as session:
-        stmt = select(Reminder).where(
-            and_(
-                Reminder.user_id == user_id,
-                Reminder.status == ReminderStatus.ACTIVE,
-                Reminder.nudge_count > 0,
-            )
-        ).order_by(Reminder.last_nudge_at.desc()).limit(1)
-        result = await session.execute(stmt)
-        reminder = result.scalar_one_or_none()
-
-        if not reminder:
-            await update.message.reply_text(
-                "🤔 Non ho reminder attivi da confermare. "
-                "Scrivimi qualcosa da ricordare!"
-            )
-            return
+        reminder = await complete_latest_nudged(session, user_id)
 
-        log = ReminderLog(user_id=user_id, reminder_id=reminder.id, action="done")
-        session.add(log)
-        await reschedule_reminder(reminder, session)
-        await session.commit()
+    if not reminder:
+        await update.message.reply_text(
+            "🤔 Non ho reminder attivi da confermare. "
+            "Scrivimi qualcosa da ricordare!"
+        )
+        return
 
     await update.message.reply_text(
         f"✅ *{reminder.title}* — fatto!",
@@ -2,16 +2,20 @@
 Onboarding flow: /start → welcome → wake time → categories → category setup → done.
 Uses ConversationHandler with states.
 """
+import asyncio
 import logging
+import re
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import (
     ContextTypes, ConversationHandler, CommandHandler,
     CallbackQueryHandler, MessageHandler, filters
 )
-from datetime import datetime, timedelta
-import pytz
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from sqlalchemy import insert, select
+from sqlalchemy import update as sa_update
 
-from database import async_session, User, Reminder, ReminderCategory, RecurrenceType, ReminderStatus
+from database import async_session, utcnow, User, Reminder, ReminderCategory, RecurrenceType, ReminderStatus
 from services.messages import (
     WELCOME, HOW_IT_WORKS, WAKE_TIME_ASK, CATEGORIES_ASK,
     ONBOARDING_DONE, MEDICINE_ASK_NAME, MEDICINE_ASK_FREQUENCY,
@@ -20,11 +24,134 @@ from services.messages import (
 
 logger = logging.getLogger(__name__)
 
+# "7:30, 15.00 e 22" → (h, m) pairs in one pass, whatever the separators
+_TIME_RE = re.compile(r"(\d{1,2})(?:[:.](\d{1,2}))?")
+
+# Per-category setup prompts and defaults. Three call sites used to carry
+# slightly different inline copies of the prompt dict; one shared table
+# keeps the wording consistent and off the per-tap allocation path.
+_CAT_PROMPTS = {
+    "car": "🚗 *Auto*\n\nQuando scade il bollo? (es. \"marzo 2026\") o /salta",
+    "house": "🏠 *Casa*\n\nGiorno del mese in cui paghi l'affitto? (es. \"5\") o /salta",
+    "health": "🩺 *Visite*\n\nTipo e data? (es. \"dentista 15 marzo\") o /salta",
+    "birthday": "🎂 *Compleanni*\n\nNome e data? (es. \"Marco 4 maggio\") o /salta",
+    "document": "📄 *Documenti*\n\nScadenza carta d'identità? (mese e anno) o /salta",
+}
+
+_CAT_DB_MAP = {
+    "car": ReminderCategory.CAR,
+    "house": ReminderCategory.HOUSE,
+    "health": ReminderCategory.HEALTH,
+    "birthday": ReminderCategory.BIRTHDAY,
+    "document": ReminderCategory.DOCUMENT,
+}
+
+# Default advance notice per category (days before the deadline)
+_CAT_ADVANCE_DAYS = {
+    "car": 30, "house": 5, "health": 3,
+    "birthday": 3, "document": 90,
+}
+
 # States
 (WELCOME_STATE, WAKE_TIME, CATEGORIES, CAT_SETUP,
  MED_NAME, MED_FREQ, MED_TIMES_SELECT, MED_TIMES_CUSTOM,
  MED_DURATION, MED_CONFIRM) = range(10)
 
+# Static keyboards, built once at import — the markup objects are
+# immutable and identical for every user, so there is no reason to
+# reallocate the button literals per tap.
+_KB_WELCOME = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🚀 Partiamo", callback_data="onb:start"),
+        InlineKeyboardButton("❓ Come funziona", callback_data="onb:how"),
+    ]
+])
+
+_KB_HOW = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🚀 Partiamo", callback_data="onb:start")]
+])
+
+_KB_WAKE = InlineKeyboardMarkup([
+    [InlineKeyboardButton("6–7", callback_data="wake:6")],
+    [InlineKeyboardButton("7–8", callback_data="wake:7")],
+    [InlineKeyboardButton("8–9", callback_data="wake:8")],
+    [InlineKeyboardButton("Dopo le 9", callback_data="wake:9")],
+])
+
+# Ordered labels for the multi-select screen; category_callback rebuilds
+# its keyboard from this when toggling checkmarks.
+_CAT_LABELS = (
+    ("car", "🚗 Auto (bollo, tagliando, assicurazione)"),
+    ("house", "🏠 Casa (affitto, bollette)"),
+    ("medicine", "💊 Farmaci e integratori"),
+    ("health", "🩺 Visite mediche"),
+    ("birthday", "🎂 Compleanni"),
+    ("document", "📄 Documenti (CI, passaporto)"),
+)
+
+_CAT_FOOTER = (
+    [InlineKeyboardButton("✅ Prosegui →", callback_data="cat:done")],
+    [InlineKeyboardButton("⏭ Salto, aggiungo dopo", callback_data="cat:skip")],
+)
+
+_KB_CATEGORIES = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(label, callback_data=f"cat:{key}")] for key, label in _CAT_LABELS]
+    + list(_CAT_FOOTER)
+)
+
+_KB_MED_FREQ = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("1 volta", callback_data="medfreq:1"),
+        InlineKeyboardButton("2 volte", callback_data="medfreq:2"),
+    ],
+    [
+        InlineKeyboardButton("3 volte", callback_data="medfreq:3"),
+        InlineKeyboardButton("Altro", callback_data="medfreq:other"),
+    ],
+])
+
+_KB_MED_TIMES_1 = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("Mattina (8:00)", callback_data="medtime:08:00"),
+        InlineKeyboardButton("Pranzo (13:00)", callback_data="medtime:13:00"),
+    ],
+    [
+        InlineKeyboardButton("Sera (21:00)", callback_data="medtime:21:00"),
+        InlineKeyboardButton("Scelgo io", callback_data="medtime:custom"),
+    ],
+])
+
+_KB_MED_TIMES_2 = InlineKeyboardMarkup([
+    [InlineKeyboardButton("8:00 + 21:00", callback_data="medtime:08:00,21:00")],
+    [InlineKeyboardButton("8:00 + 13:00", callback_data="medtime:08:00,13:00")],
+    [InlineKeyboardButton("13:00 + 21:00", callback_data="medtime:13:00,21:00")],
+    [InlineKeyboardButton("Scelgo io", callback_data="medtime:custom")],
+])
+
+_KB_MED_TIMES_3PLUS = InlineKeyboardMarkup([
+    [InlineKeyboardButton("8:00 / 14:00 / 21:00 ✅", callback_data="medtime:08:00,14:00,21:00")],
+    [InlineKeyboardButton("Scelgo io", callback_data="medtime:custom")],
+])
+
+_KB_MED_DURATION = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("Sempre", callback_data="meddur:0"),
+        InlineKeyboardButton("7 giorni", callback_data="meddur:7"),
+    ],
+    [
+        InlineKeyboardButton("14 giorni", callback_data="meddur:14"),
+        InlineKeyboardButton("30 giorni", callback_data="meddur:30"),
+    ],
+    [InlineKeyboardButton("Scelgo io", callback_data="meddur:custom")],
+])
+
+_KB_MED_CONFIRM = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("➕ Aggiungi altro", callback_data="med:another"),
+        InlineKeyboardButton("✅ Ho finito", callback_data="med:done"),
+    ]
+])
+
 
 def get_persistent_keyboard():
     """Persistent keyboard always visible at the bottom of the chat."""
@@ -49,19 +176,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not db_user:
             db_user = User(
                 id=user.id,
-                chat_id=update.effective_chat.id,
                 first_name=user.first_name,
             )
             session.add(db_user)
             await session.commit()
 
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("🚀 Partiamo", callback_data="onb:start"),
-            InlineKeyboardButton("❓ Come funziona", callback_data="onb:how"),
-        ]
-    ])
-    await update.message.reply_text(WELCOME, parse_mode="Markdown", reply_markup=keyboard)
+    await update.message.reply_text(WELCOME, parse_mode="Markdown", reply_markup=_KB_WELCOME)
     return WELCOME_STATE
 
 
@@ -71,20 +191,11 @@ async def welcome_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     if query.data == "onb:how":
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🚀 Partiamo", callback_data="onb:start")]
-        ])
-        await query.edit_message_text(HOW_IT_WORKS, parse_mode="Markdown", reply_markup=keyboard)
+        await query.edit_message_text(HOW_IT_WORKS, parse_mode="Markdown", reply_markup=_KB_HOW)
         return WELCOME_STATE
 
     if query.data == "onb:start":
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("6–7", callback_data="wake:6")],
-            [InlineKeyboardButton("7–8", callback_data="wake:7")],
-            [InlineKeyboardButton("8–9", callback_data="wake:8")],
-            [InlineKeyboardButton("Dopo le 9", callback_data="wake:9")],
-        ])
-        await query.edit_message_text(WAKE_TIME_ASK, parse_mode="Markdown", reply_markup=keyboard)
+        await query.edit_message_text(WAKE_TIME_ASK, parse_mode="Markdown", reply_markup=_KB_WAKE)
         return WAKE_TIME
 
 
@@ -95,26 +206,19 @@ async def wake_time_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     hour = int(query.data.split(":")[1])
 
+    # Direct UPDATE: no need to hydrate the user row just to set one column.
     async with async_session() as session:
-        user = await session.get(User, query.from_user.id)
-        if user:
-            user.wake_hour = hour
-            await session.commit()
+        await session.execute(
+            sa_update(User).where(User.id == query.from_user.id).values(wake_hour=hour)
+        )
+        await session.commit()
 
     context.user_data["wake_hour"] = hour
-    context.user_data["selected_categories"] = []
-
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("🚗 Auto (bollo, tagliando, assicurazione)", callback_data="cat:car")],
-        [InlineKeyboardButton("🏠 Casa (affitto, bollette)", callback_data="cat:house")],
-        [InlineKeyboardButton("💊 Farmaci e integratori", callback_data="cat:medicine")],
-        [InlineKeyboardButton("🩺 Visite mediche", callback_data="cat:health")],
-        [InlineKeyboardButton("🎂 Compleanni", callback_data="cat:birthday")],
-        [InlineKeyboardButton("📄 Documenti (CI, passaporto)", callback_data="cat:document")],
-        [InlineKeyboardButton("✅ Prosegui →", callback_data="cat:done")],
-        [InlineKeyboardButton("⏭ Salto, aggiungo dopo", callback_data="cat:skip")],
-    ])
-    await query.edit_message_text(CATEGORIES_ASK, parse_mode="Markdown", reply_markup=keyboard)
+    # A set makes the toggle/membership checks O(1); _CAT_LABELS supplies
+    # the deterministic order whenever a list is needed.
+    context.user_data["selected_categories"] = set()
+
+    await query.edit_message_text(CATEGORIES_ASK, parse_mode="Markdown", reply_markup=_KB_CATEGORIES)
     return CATEGORIES
 
 
@@ -126,44 +230,33 @@ async def category_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data
 
     if data == "cat:skip" or data == "cat:done":
-        selected = context.user_data.get("selected_categories", [])
+        selected = context.user_data.get("selected_categories", set())
 
         if not selected or data == "cat:skip":
             # Skip all, go to done
             await _finish_onboarding(query, context)
             return ConversationHandler.END
 
-        # Process first selected category
-        context.user_data["cat_queue"] = selected.copy()
+        # Queue the selected categories in screen order
+        context.user_data["cat_queue"] = [key for key, _ in _CAT_LABELS if key in selected]
         return await _process_next_category(query, context)
 
     # Toggle selection
     cat = data.split(":")[1]
-    selected = context.user_data.get("selected_categories", [])
+    selected = context.user_data.get("selected_categories", set())
 
     if cat in selected:
-        selected.remove(cat)
+        selected.discard(cat)
     else:
-        selected.append(cat)
+        selected.add(cat)
     context.user_data["selected_categories"] = selected
 
-    # Rebuild keyboard with checkmarks
-    cat_labels = {
-        "car": "🚗 Auto (bollo, tagliando, assicurazione)",
-        "house": "🏠 Casa (affitto, bollette)",
-        "medicine": "💊 Farmaci e integratori",
-        "health": "🩺 Visite mediche",
-        "birthday": "🎂 Compleanni",
-        "document": "📄 Documenti (CI, passaporto)",
-    }
-
+    # Rebuild keyboard with checkmarks (the only dynamic part of the screen)
     buttons = []
-    for key, label in cat_labels.items():
+    for key, label in _CAT_LABELS:
         check = " ✓" if key in selected else ""
         buttons.append([InlineKeyboardButton(f"{label}{check}", callback_data=f"cat:{key}")])
-
-    buttons.append([InlineKeyboardButton("✅ Prosegui →", callback_data="cat:done")])
-    buttons.append([InlineKeyboardButton("⏭ Salto, aggiungo dopo", callback_data="cat:skip")])
+    buttons.extend(_CAT_FOOTER)
 
     await query.edit_message_reply_markup(InlineKeyboardMarkup(buttons))
     return CATEGORIES
@@ -185,16 +278,8 @@ async def _process_next_category(query, context):
         await query.edit_message_text(MEDICINE_ASK_NAME, parse_mode="Markdown")
         return MED_NAME
     else:
-        # For other categories, send a simple text prompt
-        prompts = {
-            "car": "🚗 *Auto — configurazione rapida*\n\nQuando scade il bollo? Scrivimi mese e anno (es. \"marzo 2026\") o scrivi /salta",
-            "house": "🏠 *Casa*\n\nSei in affitto? Scrivimi il giorno del mese in cui paghi (es. \"5\") o scrivi /salta",
-            "health": "🩺 *Visite mediche*\n\nHai visite in programma? Scrivimi tipo e data (es. \"dentista 15 marzo\") o scrivi /salta",
-            "birthday": "🎂 *Compleanni*\n\nDimmi nome e data (es. \"Marco 4 maggio\") o scrivi /salta",
-            "document": "📄 *Documenti*\n\nQuando scade la carta d'identità? Scrivimi mese e anno o scrivi /salta",
-        }
         await query.edit_message_text(
-            prompts.get(cat, "Scrivimi i dettagli o /salta"),
+            _CAT_PROMPTS.get(cat, "Scrivimi i dettagli o /salta"),
             parse_mode="Markdown"
         )
         return CAT_SETUP
@@ -222,38 +307,27 @@ async def cat_setup_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     from services.parser import parse_reminder
     parsed = parse_reminder(text)
 
-    # Map category
-    cat_map = {
-        "car": ReminderCategory.CAR,
-        "house": ReminderCategory.HOUSE,
-        "health": ReminderCategory.HEALTH,
-        "birthday": ReminderCategory.BIRTHDAY,
-        "document": ReminderCategory.DOCUMENT,
-    }
-    db_cat = cat_map.get(cat, ReminderCategory.GENERIC)
-
-    # Set default advance days
-    advance_map = {
-        "car": 30, "house": 5, "health": 3,
-        "birthday": 3, "document": 90,
-    }
-    advance = advance_map.get(cat, 0)
+    db_cat = _CAT_DB_MAP.get(cat, ReminderCategory.GENERIC)
+    advance = _CAT_ADVANCE_DAYS.get(cat, 0)
 
     # Create reminder
     async with async_session() as session:
-        user = await session.get(User, update.effective_user.id)
-        tz = pytz.timezone(user.timezone if user else "Europe/Rome")
+        # Scalar timezone read — no ORM hydration for a single attribute.
+        tz_name = await session.scalar(
+            select(User.timezone).where(User.id == update.effective_user.id)
+        )
+        tz = ZoneInfo(tz_name or "Europe/Rome")
 
         fire_dt = parsed.fire_datetime
         if fire_dt and fire_dt.tzinfo:
-            fire_utc = fire_dt.astimezone(pytz.UTC).replace(tzinfo=None)
+            fire_utc = fire_dt.astimezone(timezone.utc)
         elif fire_dt:
-            fire_utc = tz.localize(fire_dt).astimezone(pytz.UTC).replace(tzinfo=None)
+            fire_utc = fire_dt.replace(tzinfo=tz).astimezone(timezone.utc)
         else:
-            fire_utc = datetime.utcnow() + timedelta(days=1)
+            fire_utc = utcnow() + timedelta(days=1)
 
         # For advance reminders, subtract advance days
-        if advance > 0 and fire_utc > datetime.utcnow() + timedelta(days=advance):
+        if advance > 0 and fire_utc > utcnow() + timedelta(days=advance):
             actual_fire = fire_utc - timedelta(days=advance)
         else:
             actual_fire = fire_utc
@@ -267,9 +341,19 @@ async def cat_setup_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             advance_days=advance,
         )
         session.add(reminder)
-        await session.commit()
 
-    await update.message.reply_text(f"✅ *{parsed.title}* salvato! Ti ricorderò per tempo.", parse_mode="Markdown")
+        # The confirmation only uses local state, so the commit and the
+        # Telegram round-trip can overlap: cost max(db, telegram), not the sum.
+        results = await asyncio.gather(
+            session.commit(),
+            update.message.reply_text(
+                f"✅ *{parsed.title}* salvato! Ti ricorderò per tempo.", parse_mode="Markdown"
+            ),
+            return_exceptions=True,
+        )
+        for r in results:
+            if isinstance(r, BaseException):
+                logger.error(f"Category setup save failed: {type(r).__name__}: {r}")
 
     # Next category
     queue = context.user_data.get("cat_queue", [])
@@ -289,14 +373,7 @@ async def _send_cat_prompt(update, context, cat):
         await update.message.reply_text(MEDICINE_ASK_NAME, parse_mode="Markdown")
         return MED_NAME
 
-    prompts = {
-        "car": "🚗 *Auto*\n\nQuando scade il bollo? (es. \"marzo 2026\") o /salta",
-        "house": "🏠 *Casa*\n\nGiorno del mese in cui paghi l'affitto? (es. \"5\") o /salta",
-        "health": "🩺 *Visite*\n\nTipo e data? (es. \"dentista 15 marzo\") o /salta",
-        "birthday": "🎂 *Compleanni*\n\nNome e data? (es. \"Marco 4 maggio\") o /salta",
-        "document": "📄 *Documenti*\n\nScadenza carta d'identità? (mese e anno) o /salta",
-    }
-    await update.message.reply_text(prompts.get(cat, "/salta"), parse_mode="Markdown")
+    await update.message.reply_text(_CAT_PROMPTS.get(cat, "/salta"), parse_mode="Markdown")
     return CAT_SETUP
 
 
@@ -318,17 +395,7 @@ async def med_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     context.user_data["med_name"] = name
 
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("1 volta", callback_data="medfreq:1"),
-            InlineKeyboardButton("2 volte", callback_data="medfreq:2"),
-        ],
-        [
-            InlineKeyboardButton("3 volte", callback_data="medfreq:3"),
-            InlineKeyboardButton("Altro", callback_data="medfreq:other"),
-        ],
-    ])
-    await update.message.reply_text(MEDICINE_ASK_FREQUENCY, reply_markup=keyboard)
+    await update.message.reply_text(MEDICINE_ASK_FREQUENCY, reply_markup=_KB_MED_FREQ)
     return MED_FREQ
 
 
@@ -348,28 +415,11 @@ async def med_freq_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Show time options based on frequency
     if freq_num == 1:
-        keyboard = InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("Mattina (8:00)", callback_data="medtime:08:00"),
-                InlineKeyboardButton("Pranzo (13:00)", callback_data="medtime:13:00"),
-            ],
-            [
-                InlineKeyboardButton("Sera (21:00)", callback_data="medtime:21:00"),
-                InlineKeyboardButton("Scelgo io", callback_data="medtime:custom"),
-            ],
-        ])
+        keyboard = _KB_MED_TIMES_1
     elif freq_num == 2:
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("8:00 + 21:00", callback_data="medtime:08:00,21:00")],
-            [InlineKeyboardButton("8:00 + 13:00", callback_data="medtime:08:00,13:00")],
-            [InlineKeyboardButton("13:00 + 21:00", callback_data="medtime:13:00,21:00")],
-            [InlineKeyboardButton("Scelgo io", callback_data="medtime:custom")],
-        ])
+        keyboard = _KB_MED_TIMES_2
     else:  # 3+
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("8:00 / 14:00 / 21:00 ✅", callback_data="medtime:08:00,14:00,21:00")],
-            [InlineKeyboardButton("Scelgo io", callback_data="medtime:custom")],
-        ])
+        keyboard = _KB_MED_TIMES_3PLUS
 
     await query.edit_message_text("A che ora vuoi che ti ricordi?", reply_markup=keyboard)
     return MED_TIMES_SELECT
@@ -402,51 +452,26 @@ async def med_times_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return MED_TIMES_CUSTOM
 
-    context.user_data["med_times"] = times_str.split(",")
+    times = times_str.split(",")
+    context.user_data["med_times"] = times
+    # Parse once here; _save_medicine works with ints and keeps the
+    # string form only for the fire_times column and the confirmation.
+    context.user_data["med_times_hm"] = [tuple(map(int, t.split(":"))) for t in times]
 
-    # Ask duration
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("Sempre", callback_data="meddur:0"),
-            InlineKeyboardButton("7 giorni", callback_data="meddur:7"),
-        ],
-        [
-            InlineKeyboardButton("14 giorni", callback_data="meddur:14"),
-            InlineKeyboardButton("30 giorni", callback_data="meddur:30"),
-        ],
-        [InlineKeyboardButton("Scelgo io", callback_data="meddur:custom")],
-    ])
-    await query.edit_message_text(MEDICINE_ASK_DURATION, reply_markup=keyboard)
+    await query.edit_message_text(MEDICINE_ASK_DURATION, reply_markup=_KB_MED_DURATION)
     return MED_DURATION
 
 
 async def med_times_custom(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle custom time input for medicine."""
     text = update.message.text.strip()
-    times_raw = [t.strip().replace(".", ":") for t in text.replace(" e ", ",").split(",")]
 
-    times = []
-    for t in times_raw:
-        if ":" not in t:
-            t = f"{t}:00"
-        if len(t.split(":")[0]) == 1:
-            t = f"0{t}"
-        times.append(t)
+    pairs = [(int(h), int(m or 0)) for h, m in _TIME_RE.findall(text)]
 
-    context.user_data["med_times"] = times
+    context.user_data["med_times_hm"] = pairs
+    context.user_data["med_times"] = [f"{h:02d}:{m:02d}" for h, m in pairs]
 
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("Sempre", callback_data="meddur:0"),
-            InlineKeyboardButton("7 giorni", callback_data="meddur:7"),
-        ],
-        [
-            InlineKeyboardButton("14 giorni", callback_data="meddur:14"),
-            InlineKeyboardButton("30 giorni", callback_data="meddur:30"),
-        ],
-        [InlineKeyboardButton("Scelgo io", callback_data="meddur:custom")],
-    ])
-    await update.message.reply_text(MEDICINE_ASK_DURATION, reply_markup=keyboard)
+    await update.message.reply_text(MEDICINE_ASK_DURATION, reply_markup=_KB_MED_DURATION)
     return MED_DURATION
 
 
@@ -485,67 +510,71 @@ async def _save_medicine(source, context, is_callback=False):
 
     name = context.user_data.get("med_name", "Farmaco")
     times = context.user_data.get("med_times", ["08:00"])
+    times_hm = context.user_data.get("med_times_hm") or [tuple(map(int, t.split(":"))) for t in times]
     duration = context.user_data.get("med_duration", 0)
 
     async with async_session() as session:
-        user = await session.get(User, user_id)
-        tz = pytz.timezone(user.timezone if user else "Europe/Rome")
+        # Only the timezone is needed here — a scalar SELECT skips ORM hydration.
+        tz_name = await session.scalar(select(User.timezone).where(User.id == user_id))
+        tz = ZoneInfo(tz_name or "Europe/Rome")
         now = datetime.now(tz)
 
         end_date = None
         if duration > 0:
-            end_date = (now + timedelta(days=duration)).astimezone(pytz.UTC).replace(tzinfo=None)
+            end_date = (now + timedelta(days=duration)).astimezone(timezone.utc)
 
-        # Create one reminder per time slot
-        for idx, t in enumerate(times):
-            h, m = map(int, t.split(":"))
+        # One executemany INSERT for all time slots instead of a session.add
+        # per slot — a single round-trip however many doses per day.
+        rows = []
+        for idx, (h, m) in enumerate(times_hm):
             fire_local = now.replace(hour=h, minute=m, second=0, microsecond=0)
             if fire_local <= now:
                 fire_local += timedelta(days=1)
-            fire_utc = fire_local.astimezone(pytz.UTC).replace(tzinfo=None)
-
-            reminder = Reminder(
-                user_id=user_id,
-                title=name,
-                category=ReminderCategory.MEDICINE,
-                next_fire=fire_utc,
-                recurrence=RecurrenceType.DAILY,
-                fire_times=",".join(times),
-                end_date=end_date,
-                time_slot_index=idx,
-                time_slot_total=len(times),
-            )
-            session.add(reminder)
-
-        await session.commit()
 
-    # Build confirmation
-    times_str = " · ".join(times)
-    dur_str = f"{duration} giorni" if duration > 0 else "a tempo indeterminato"
-    end_str = ""
-    if duration > 0:
-        end_dt = datetime.now() + timedelta(days=duration)
-        end_str = f" (fino al {end_dt.strftime('%d/%m')})"
-
-    confirm_text = (
-        f"✅ *{name}*\n"
-        f"📅 Ogni giorno — {len(times)} {'volta' if len(times) == 1 else 'volte'}\n"
-        f"⏰ {times_str}\n"
-        f"⏳ {dur_str}{end_str}\n\n"
-        f"{MEDICINE_ADDED}"
-    )
+            rows.append({
+                "user_id": user_id,
+                "title": name,
+                "category": ReminderCategory.MEDICINE,
+                "next_fire": fire_local.astimezone(timezone.utc),
+                "recurrence": RecurrenceType.DAILY,
+                "fire_times": times,
+                "end_date": end_date,
+                "time_slot_index": idx,
+                "time_slot_total": len(times),
+            })
+
+        await session.execute(insert(Reminder), rows)
+
+        # Build confirmation — local state only, nothing from the commit
+        times_str = " · ".join(times)
+        dur_str = f"{duration} giorni" if duration > 0 else "a tempo indeterminato"
+        end_str = ""
+        if duration > 0:
+            end_str = f" (fino al {(now + timedelta(days=duration)).strftime('%d/%m')})"
+
+        confirm_text = (
+            f"✅ *{name}*\n"
+            f"📅 Ogni giorno — {len(times)} {'volta' if len(times) == 1 else 'volte'}\n"
+            f"⏰ {times_str}\n"
+            f"⏳ {dur_str}{end_str}\n\n"
+            f"{MEDICINE_ADDED}"
+        )
 
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("➕ Aggiungi altro", callback_data="med:another"),
-            InlineKeyboardButton("✅ Ho finito", callback_data="med:done"),
-        ]
-    ])
+        if is_callback:
+            send = source.callback_query.edit_message_text(
+                confirm_text, parse_mode="Markdown", reply_markup=_KB_MED_CONFIRM
+            )
+        else:
+            send = source.message.reply_text(
+                confirm_text, parse_mode="Markdown", reply_markup=_KB_MED_CONFIRM
+            )
 
-    if is_callback:
-        await source.callback_query.edit_message_text(confirm_text, parse_mode="Markdown", reply_markup=keyboard)
-    else:
-        await source.message.reply_text(confirm_text, parse_mode="Markdown", reply_markup=keyboard)
+        # Overlap the commit with the Telegram round-trip (same pattern as
+        # _commit_and_edit in handlers/callbacks.py).
+        results = await asyncio.gather(session.commit(), send, return_exceptions=True)
+        for r in results:
+            if isinstance(r, BaseException):
+                logger.error(f"Medicine save failed: {type(r).__name__}: {r}")
 
     return MED_CONFIRM
 
@@ -570,14 +599,7 @@ async def med_confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             await query.edit_message_text(MEDICINE_ASK_NAME, parse_mode="Markdown")
             return MED_NAME
         else:
-            prompts = {
-                "car": "🚗 *Auto*\n\nQuando scade il bollo? (es. \"marzo 2026\") o /salta",
-                "house": "🏠 *Casa*\n\nGiorno del mese per l'affitto? (es. \"5\") o /salta",
-                "health": "🩺 *Visite*\n\nTipo e data? (es. \"dentista 15 marzo\") o /salta",
-                "birthday": "🎂 *Compleanni*\n\nNome e data? (es. \"Marco 4 maggio\") o /salta",
-                "document": "📄 *Documenti*\n\nScadenza CI? (mese e anno) o /salta",
-            }
-            await query.edit_message_text(prompts.get(cat, "/salta"), parse_mode="Markdown")
+            await query.edit_message_text(_CAT_PROMPTS.get(cat, "/salta"), parse_mode="Markdown")
             return CAT_SETUP
 
     await _finish_onboarding(query, context)
@@ -587,10 +609,10 @@ async def med_confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYP
 async def _finish_onboarding(query, context):
     """Mark onboarding as done and show persistent keyboard."""
     async with async_session() as session:
-        user = await session.get(User, query.from_user.id)
-        if user:
-            user.onboarding_done = True
-            await session.commit()
+        await session.execute(
+            sa_update(User).where(User.id == query.from_user.id).values(onboarding_done=True)
+        )
+        await session.commit()
 
     # edit_message_text can't send ReplyKeyboardMarkup, so we send a new message
     await query.edit_message_text(ONBOARDING_DONE, parse_mode="Markdown")
@@ -603,10 +625,10 @@ async def _finish_onboarding(query, context):
 async def _finish_onboarding_msg(update, context):
     """Mark onboarding done (from message context) and show persistent keyboard."""
     async with async_session() as session:
-        user = await session.get(User, update.effective_user.id)
-        if user:
-            user.onboarding_done = True
-            await session.commit()
+        await session.execute(
+            sa_update(User).where(User.id == update.effective_user.id).values(onboarding_done=True)
+        )
+        await session.commit()
 
     await update.message.reply_text(
         ONBOARDING_DONE,
@@ -621,30 +643,39 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+def _prefix(prefix: str):
+    """Pattern callable for CallbackQueryHandler.
+
+    All onboarding callback data has the form "prefix:value", so a plain
+    startswith check routes it without running the regex engine per update.
+    """
+    return lambda data: isinstance(data, str) and data.startswith(prefix)
+
+
 def get_onboarding_handler() -> ConversationHandler:
     """Build the onboarding ConversationHandler."""
     return ConversationHandler(
         entry_points=[CommandHandler("start", start)],
         states={
-            WELCOME_STATE: [CallbackQueryHandler(welcome_callback, pattern=r"^onb:")],
-            WAKE_TIME: [CallbackQueryHandler(wake_time_callback, pattern=r"^wake:")],
-            CATEGORIES: [CallbackQueryHandler(category_callback, pattern=r"^cat:")],
+            WELCOME_STATE: [CallbackQueryHandler(welcome_callback, pattern=_prefix("onb:"))],
+            WAKE_TIME: [CallbackQueryHandler(wake_time_callback, pattern=_prefix("wake:"))],
+            CATEGORIES: [CallbackQueryHandler(category_callback, pattern=_prefix("cat:"))],
             CAT_SETUP: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, cat_setup_text),
                 CommandHandler("salta", cat_setup_text),
             ],
             MED_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, med_name)],
             MED_FREQ: [
-                CallbackQueryHandler(med_freq_callback, pattern=r"^medfreq:"),
+                CallbackQueryHandler(med_freq_callback, pattern=_prefix("medfreq:")),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, med_freq_text),
             ],
-            MED_TIMES_SELECT: [CallbackQueryHandler(med_times_callback, pattern=r"^medtime:")],
+            MED_TIMES_SELECT: [CallbackQueryHandler(med_times_callback, pattern=_prefix("medtime:"))],
             MED_TIMES_CUSTOM: [MessageHandler(filters.TEXT & ~filters.COMMAND, med_times_custom)],
             MED_DURATION: [
-                CallbackQueryHandler(med_duration_callback, pattern=r"^meddur:"),
+                CallbackQueryHandler(med_duration_callback, pattern=_prefix("meddur:")),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, med_duration_text),
             ],
-            MED_CONFIRM: [CallbackQueryHandler(med_confirm_callback, pattern=r"^med:")],
+            MED_CONFIRM: [CallbackQueryHandler(med_confirm_callback, pattern=_prefix("med:"))],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
         per_user=True,
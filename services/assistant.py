@@ -6,19 +6,23 @@ Supports contextual replies: when the bot sends a reminder and the user replies
 with text/voice within 15 minutes, the assistant handles it in context.
 """
 import logging
-from datetime import datetime, timedelta
+import re
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 from dataclasses import dataclass, field
 
 from sqlalchemy import select, and_
-import pytz
+from zoneinfo import ZoneInfo
 
 from database import (
-    async_session, Reminder, ReminderLog, User,
+    async_session, utcnow, Reminder, ReminderLog, User,
     ReminderStatus, ReminderCategory, RecurrenceType
 )
 from services.llm import classify_and_parse
-from services.parser import parse_reminder, ParsedReminder, format_confirmation
+from services.parser import (
+    parse_reminder, ParsedReminder, format_confirmation,
+    _FAST_DAY_RE, _FAST_TIME_RE, _TRA_RE,
+)
 from services.messages import get_emoji
 
 logger = logging.getLogger(__name__)
@@ -26,13 +30,23 @@ logger = logging.getLogger(__name__)
 # Max time (minutes) to consider a reply as contextual to a sent reminder
 REPLY_CONTEXT_WINDOW = 15
 
+# Fast-path create detection: an explicit imperative ("ricordami ...")
+# plus a day anchor and an explicit time parses deterministically with
+# the regex parser, so those messages skip the LLM round-trip — the
+# single biggest latency win on the common path. The date/time gate
+# reuses parser.py's own patterns (_TRA_RE for relative offsets,
+# _FAST_DAY_RE/_FAST_TIME_RE for anchored day+time) so it only admits
+# the constructs parse_reminder is known to resolve; looser signals
+# ("tra 10 giorni", "ogni weekend") still go to the LLM.
+_CREATE_PREFIX_RE = re.compile(r"^(?:ricordami|ricorda|promemoria|reminder)\b", re.IGNORECASE)
+
 
 @dataclass
 class AssistantResponse:
     """What the assistant wants to send back to the user."""
     text: str
     parse_mode: str = "Markdown"
-    pending_reminder: Optional[dict] = None
+    pending_reminder: Optional[ParsedReminder] = None
     show_confirm: bool = False
     confirm_delete_id: Optional[int] = None
     confirm_delete_title: Optional[str] = None
@@ -51,14 +65,14 @@ async def _get_active_reminders(user_id: int, tz) -> list[dict]:
 
     out = []
     for r in reminders:
-        fire_local = pytz.UTC.localize(r.next_fire).astimezone(tz)
+        fire_local = r.next_fire.astimezone(tz)
         out.append({
             "id": r.id,
             "title": r.title,
             "category": r.category,
             "next_fire": fire_local.strftime("%d/%m/%Y %H:%M"),
             "recurrence": r.recurrence,
-            "fire_times": r.fire_times or "",
+            "fire_times": ",".join(r.fire_times or []),
         })
     return out
 
@@ -102,13 +116,12 @@ async def _find_reminder_by_match(user_id: int, reminder_id: Optional[int], titl
 
 def _format_reminder_line(r: Reminder, tz) -> Optional[str]:
     emoji = get_emoji(r.category)
-    fire_local = pytz.UTC.localize(r.next_fire).astimezone(tz)
+    fire_local = r.next_fire.astimezone(tz)
     time_str = fire_local.strftime("%H:%M")
 
     if r.fire_times and r.time_slot_index == 0:
-        times = r.fire_times.split(",")
         joiner = " · "
-        return "{} {} _({})_".format(emoji, r.title, joiner.join(times))
+        return "{} {} _({})_".format(emoji, r.title, joiner.join(r.fire_times))
     elif r.fire_times and r.time_slot_index and r.time_slot_index > 0:
         return None
     return "{} {} _({})_".format(emoji, r.title, time_str)
@@ -121,7 +134,7 @@ def _get_recent_reminder_context(user_id: int) -> Optional[dict]:
     if not ctx:
         return None
 
-    age_minutes = (datetime.utcnow() - ctx["sent_at"]).total_seconds() / 60
+    age_minutes = (utcnow() - ctx["sent_at"]).total_seconds() / 60
     if age_minutes > REPLY_CONTEXT_WINDOW:
         return None
 
@@ -132,18 +145,40 @@ def _get_recent_reminder_context(user_id: int) -> Optional[dict]:
 # Main entry point
 # ─────────────────────────────────────────────
 
-async def process_message(user_id: int, chat_id: int, text: str, first_name: str = "") -> AssistantResponse:
+async def process_message(user_id: int, text: str, first_name: str = "") -> AssistantResponse:
     async with async_session() as session:
         user = await session.get(User, user_id)
         if not user:
-            user = User(id=user_id, chat_id=chat_id, first_name=first_name)
+            user = User(id=user_id, first_name=first_name)
             session.add(user)
             await session.commit()
 
-    tz = pytz.timezone(user.timezone if user else "Europe/Rome")
+    tz = ZoneInfo(user.timezone if user else "Europe/Rome")
     tz_name = user.timezone if user else "Europe/Rome"
 
     recent_ctx = _get_recent_reminder_context(user_id)
+
+    # Deterministic create: no LLM call and no reminder-list query
+    # needed. The result is only trusted when the parse genuinely
+    # anchored a fire time and extracted an action — parse_reminder
+    # backfills tomorrow 09:00 when nothing matches, and confirming
+    # that default would silently create the wrong reminder.
+    stripped = text.strip()
+    lower = stripped.lower()
+    if (recent_ctx is None and _CREATE_PREFIX_RE.match(stripped)
+            and (_TRA_RE.search(lower)
+                 or (_FAST_DAY_RE.search(lower) and _FAST_TIME_RE.search(lower)))):
+        parsed = parse_reminder(text, tz_name)
+        if (parsed.title and len(parsed.title) >= 2
+                and parsed.fire_datetime and parsed.title.lower() != lower):
+            logger.info("Fast-path regex create for user=%s", user_id)
+            return AssistantResponse(
+                text=format_confirmation(parsed),
+                pending_reminder=parsed,
+                show_confirm=True,
+            )
+        logger.info("Fast-path create miss, deferring to LLM")
+
     active_reminders = await _get_active_reminders(user_id, tz)
 
     llm_result = await classify_and_parse(text, tz_name, active_reminders, recent_ctx)
@@ -195,22 +230,13 @@ async def _handle_create(data: dict, tz_name: str) -> AssistantResponse:
                  "ad esempio:\n_\"domani alle 10 chiama il dentista\"_"
         )
 
-    pending = {
-        "title": parsed.title,
-        "category": parsed.category.value if isinstance(parsed.category, ReminderCategory) else parsed.category,
-        "fire_datetime": parsed.fire_datetime.isoformat() if parsed.fire_datetime else None,
-        "recurrence": parsed.recurrence.value if isinstance(parsed.recurrence, RecurrenceType) else parsed.recurrence,
-        "recurrence_days": parsed.recurrence_days,
-        "fire_times": parsed.fire_times,
-        "end_date": parsed.end_date.isoformat() if parsed.end_date else None,
-        "advance_days": parsed.advance_days,
-    }
-
+    # Hand the ParsedReminder over as-is: context.user_data is plain
+    # in-process memory, so there is nothing to serialize.
     confirm_text = format_confirmation(parsed)
 
     return AssistantResponse(
         text=confirm_text,
-        pending_reminder=pending,
+        pending_reminder=parsed,
         show_confirm=True,
     )
 
@@ -224,22 +250,11 @@ async def _handle_create_fallback(text: str, tz_name: str) -> AssistantResponse:
                  "ad esempio:\n_\"domani alle 10 chiama il dentista\"_"
         )
 
-    pending = {
-        "title": parsed.title,
-        "category": parsed.category.value,
-        "fire_datetime": parsed.fire_datetime.isoformat() if parsed.fire_datetime else None,
-        "recurrence": parsed.recurrence.value,
-        "recurrence_days": parsed.recurrence_days,
-        "fire_times": parsed.fire_times,
-        "end_date": parsed.end_date.isoformat() if parsed.end_date else None,
-        "advance_days": parsed.advance_days,
-    }
-
     confirm_text = format_confirmation(parsed)
 
     return AssistantResponse(
         text=confirm_text,
-        pending_reminder=pending,
+        pending_reminder=parsed,
         show_confirm=True,
     )
 
@@ -267,8 +282,8 @@ async def _handle_query(user_id: int, data: dict, tz) -> AssistantResponse:
         end = start + timedelta(days=365)
         label = "Tutti i reminder"
 
-    start_utc = start.astimezone(pytz.UTC).replace(tzinfo=None)
-    end_utc = end.astimezone(pytz.UTC).replace(tzinfo=None)
+    start_utc = start.astimezone(timezone.utc)
+    end_utc = end.astimezone(timezone.utc)
 
     reminders = await _get_reminders_in_range(user_id, start_utc, end_utc, category)
 
@@ -296,7 +311,7 @@ async def _handle_query(user_id: int, data: dict, tz) -> AssistantResponse:
         lines = ["*{}:*".format(label)]
         current_day = None
         for r in reminders:
-            fire_local = pytz.UTC.localize(r.next_fire).astimezone(tz)
+            fire_local = r.next_fire.astimezone(tz)
             day_key = fire_local.strftime("%Y-%m-%d")
             if day_key != current_day:
                 current_day = day_key
@@ -323,7 +338,7 @@ async def _handle_delete(user_id: int, data: dict, tz) -> AssistantResponse:
         return AssistantResponse(text=msg)
 
     emoji = get_emoji(reminder.category)
-    fire_local = pytz.UTC.localize(reminder.next_fire).astimezone(tz)
+    fire_local = reminder.next_fire.astimezone(tz)
 
     return AssistantResponse(
         text="Vuoi cancellare {} *{}* ({})?".format(
@@ -356,7 +371,7 @@ async def _handle_modify(user_id: int, data: dict, tz) -> AssistantResponse:
             return AssistantResponse(text="Errore: reminder non trovato.")
 
         if new_date or new_time:
-            old_fire = pytz.UTC.localize(r.next_fire).astimezone(tz)
+            old_fire = r.next_fire.astimezone(tz)
             new_dt = old_fire
 
             if new_date:
@@ -376,12 +391,12 @@ async def _handle_modify(user_id: int, data: dict, tz) -> AssistantResponse:
                     pass
 
             if changed:
-                r.next_fire = new_dt.astimezone(pytz.UTC).replace(tzinfo=None)
+                r.next_fire = new_dt.astimezone(timezone.utc)
                 await session.commit()
 
     if changed:
         emoji = get_emoji(reminder.category)
-        new_fire_local = pytz.UTC.localize(r.next_fire).astimezone(tz)
+        new_fire_local = r.next_fire.astimezone(tz)
         return AssistantResponse(
             text="{} *{}* spostato al {} ore {}".format(
                 emoji, reminder.title,
@@ -434,19 +449,19 @@ async def _handle_reminder_reply(user_id: int, data: dict, tz_name: str) -> Assi
             return AssistantResponse(text="Reminder non trovato.")
 
         user = await session.get(User, user_id)
-        tz = pytz.timezone(user.timezone if user else "Europe/Rome")
+        tz = ZoneInfo(user.timezone if user else "Europe/Rome")
         emoji = get_emoji(reminder.category)
 
         if action == "done":
             log = ReminderLog(user_id=user_id, reminder_id=reminder.id, action="done")
             session.add(log)
-            await reschedule_reminder(reminder, session)
+            await reschedule_reminder(reminder, session, user)
             await session.commit()
             last_sent_reminders.pop(user_id, None)
             return AssistantResponse(text="*{}* — fatto!".format(reminder.title))
 
         elif action == "snooze":
-            reminder.next_fire = datetime.utcnow() + timedelta(minutes=snooze_minutes)
+            reminder.next_fire = utcnow() + timedelta(minutes=snooze_minutes)
             reminder.nudge_count = 0
             reminder.last_nudge_at = None
             reminder.snooze_count += 1
@@ -469,12 +484,12 @@ async def _handle_reminder_reply(user_id: int, data: dict, tz_name: str) -> Assi
         elif action == "skip":
             log = ReminderLog(user_id=user_id, reminder_id=reminder.id, action="skipped")
             session.add(log)
-            await reschedule_reminder(reminder, session)
+            await reschedule_reminder(reminder, session, user)
             await session.commit()
             last_sent_reminders.pop(user_id, None)
 
             if reminder.status == ReminderStatus.ACTIVE and reminder.next_fire:
-                next_local = pytz.UTC.localize(reminder.next_fire).astimezone(tz)
+                next_local = reminder.next_fire.astimezone(tz)
                 return AssistantResponse(
                     text="{} *{}* saltato per oggi. Prossimo: {}.".format(
                         emoji, reminder.title, next_local.strftime("%d/%m alle %H:%M")
@@ -483,9 +498,9 @@ async def _handle_reminder_reply(user_id: int, data: dict, tz_name: str) -> Assi
             return AssistantResponse(text="{} *{}* saltato!".format(emoji, reminder.title))
 
         elif action == "tomorrow":
-            current_fire = pytz.UTC.localize(reminder.next_fire).astimezone(tz)
+            current_fire = reminder.next_fire.astimezone(tz)
             tomorrow = current_fire + timedelta(days=1)
-            reminder.next_fire = tomorrow.astimezone(pytz.UTC).replace(tzinfo=None)
+            reminder.next_fire = tomorrow.astimezone(timezone.utc)
             reminder.nudge_count = 0
             reminder.last_nudge_at = None
             reminder.snooze_count += 1
@@ -4,20 +4,89 @@ LLM service using Groq API (free tier) for natural language understanding.
 - transcribe_audio: audio bytes → text (Whisper Large v3)
 Uses httpx for async HTTP calls (no blocking the event loop).
 """
+import asyncio
 import json
 import logging
 import os
+import re
+import time
+from collections import OrderedDict
 from datetime import datetime
 from typing import Optional
 
 import httpx
-import pytz
+from zoneinfo import ZoneInfo
+
+try:  # HTTP/2 needs the optional h2 package (httpx[http2])
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:  # pragma: no cover — falls back to HTTP/1.1
+    _HTTP2 = False
 
 logger = logging.getLogger(__name__)
 
 GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
 GROQ_AUDIO_URL = "https://api.groq.com/openai/v1/audio/transcriptions"
 
+# One process-wide client so consecutive Groq calls reuse the keep-alive
+# connection instead of paying TCP + TLS setup (hundreds of ms) per parse.
+_http_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Lazily create the shared AsyncClient on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            # HTTP/2 multiplexes concurrent calls on one connection and
+            # HPACK-compresses the repeated auth/content-type headers.
+            http2=_HTTP2,
+            timeout=10.0,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+        )
+    return _http_client
+
+
+# Headers are identical across calls; rebuilt only if the key changes
+# (env reads stay inside the request functions so tests can override).
+_cached_headers: tuple[str, dict] | None = None
+
+
+def _auth_headers(api_key: str) -> dict:
+    global _cached_headers
+    if _cached_headers is None or _cached_headers[0] != api_key:
+        _cached_headers = (
+            api_key,
+            {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        )
+    return _cached_headers[1]
+
+
+async def warmup_http_client():
+    """Prime the TLS session to api.groq.com at startup.
+
+    Fired as a background task from post_init so the first real parse
+    doesn't pay the cold-start handshake (~200-400ms).
+    """
+    api_key = os.environ.get("GROQ_API_KEY", "").strip()
+    if not api_key:
+        return
+    try:
+        await get_http_client().get(
+            "https://api.groq.com/openai/v1/models",
+            headers=_auth_headers(api_key),
+        )
+    except Exception as e:
+        logger.debug("Groq warmup failed: %s: %s", type(e).__name__, e)
+
+
+async def close_http_client():
+    """Close the shared client; hooked into the bot's shutdown."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
 SYSTEM_PROMPT = """Sei Svampito, un assistente per reminder su Telegram. Ricevi il messaggio dell'utente, la lista dei suoi reminder attivi, e opzionalmente il contesto di un reminder appena inviato.
 
 Devi decidere cosa vuole l'utente e rispondere con un JSON.
@@ -99,7 +168,7 @@ REGOLE PER CREATE:
    - "ogni mese" → monthly
    - Nessuna indicazione → once
 6. CATEGORIE: medicine(farmaco,pillola,vitamina,antibiotico), health(dentista,medico,visita), car(meccanico,bollo,tagliando), house(affitto,bolletta), birthday(compleanno), document(passaporto,patente,730), habit(palestra,yoga,corsa), generic(resto)
-7. ADVANCE_DAYS: document=90, car=30, house=5, health=3, birthday=3, altri=0
+7. ADVANCE_DAYS: 0 salvo richiesta esplicita ("avvisami N giorni prima")
 
 ESEMPI:
 
@@ -139,6 +208,90 @@ Input: "dopo pranzo"
 """
 
 
+# Invariant request parts, shared across calls: the system message wraps
+# the ~2KB prompt once, and the sampling options never change.
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+_PAYLOAD_OPTS = {
+    "temperature": 0.1,
+    "max_tokens": 500,
+    "response_format": {"type": "json_object"},
+}
+_DAY_NAMES = ("lunedi", "martedi", "mercoledi", "giovedi", "venerdi", "sabato", "domenica")
+
+# Default lead time per category, applied after the LLM responds. Keeping
+# this table out of the prompt means it can't be mis-transcribed by the
+# model and shaves a rule from every request's prefill.
+_ADVANCE_DAYS = {"document": 90, "car": 30, "house": 5, "health": 3, "birthday": 3}
+
+# Signals that an input needs the full model: recurrence, ranges,
+# durations, conditionals, or more than one explicit time.
+_COMPLEX_RE = re.compile(
+    r"\bogni\b|tutti\s+i\s+giorni|giorni\s+alterni|feriali|weekend"
+    r"|dal\s+\w+\s+al\s+\w+|fino\s+a|per\s+\d+\s+giorn|\bse\b"
+)
+_TIME_TOKEN_RE = re.compile(r"\balle?\s+\d|\d{1,2}[:.]\d{2}")
+
+
+# Structural checks on create payloads, precompiled once. A malformed
+# date/time would otherwise slip through and silently become the
+# "tomorrow at 9" default downstream; failing fast here triggers the
+# model-tier retry and ultimately the regex fallback instead.
+_DATE_FMT_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_TIME_FMT_RE = re.compile(r"^\d{1,2}:\d{2}$")
+
+
+def _validate_create(data: dict) -> bool:
+    for field in ("date", "end_date"):
+        value = data.get(field)
+        if value and not _DATE_FMT_RE.match(str(value)):
+            return False
+    time_value = data.get("time")
+    if time_value and not _TIME_FMT_RE.match(str(time_value)):
+        return False
+    fire_times = data.get("fire_times")
+    if fire_times and not (
+        isinstance(fire_times, list)
+        and all(isinstance(t, str) and _TIME_FMT_RE.match(t) for t in fire_times)
+    ):
+        return False
+    return True
+
+
+# Circuit breaker: during a Groq outage every message would otherwise
+# pay the full HTTP timeout before reaching the regex fallback. After
+# _BREAKER_THRESHOLD consecutive transport failures the circuit opens
+# and calls fail fast (-> fallback) for _BREAKER_COOLDOWN seconds.
+_BREAKER_THRESHOLD = 3
+_BREAKER_COOLDOWN = 30.0
+_breaker_failures = 0
+_breaker_open_until = 0.0
+
+
+def _breaker_trip():
+    global _breaker_failures, _breaker_open_until
+    _breaker_failures += 1
+    if _breaker_failures >= _BREAKER_THRESHOLD:
+        _breaker_open_until = time.monotonic() + _BREAKER_COOLDOWN
+        logger.error("LLM circuit opened for %.0fs after %d consecutive failures",
+                     _BREAKER_COOLDOWN, _breaker_failures)
+
+
+def _breaker_reset():
+    global _breaker_failures, _breaker_open_until
+    _breaker_failures = 0
+    _breaker_open_until = 0.0
+
+
+def _is_simple(text: str) -> bool:
+    """Short single-time inputs a small model handles reliably."""
+    lower = text.lower()
+    return (
+        len(text) <= 80
+        and not _COMPLEX_RE.search(lower)
+        and len(_TIME_TOKEN_RE.findall(lower)) <= 1
+    )
+
+
 async def classify_and_parse(
     text: str,
     user_tz: str = "Europe/Rome",
@@ -150,16 +303,26 @@ async def classify_and_parse(
     """
     api_key = os.environ.get("GROQ_API_KEY", "").strip()
     model = os.environ.get("GROQ_MODEL", "llama-3.1-8b-instant").strip()
+    small_model = os.environ.get("GROQ_MODEL_SMALL", "").strip()
 
     if not api_key:
         logger.warning("GROQ_API_KEY not set, cannot classify intent")
         return None
 
+    if time.monotonic() < _breaker_open_until:
+        logger.warning("LLM circuit open, skipping Groq call")
+        return None
+
+    # Opt-in tiering: try the cheaper/faster model for simple inputs and
+    # escalate to the full one if it returns unusable output.
+    models = (model,)
+    if small_model and small_model != model and _is_simple(text):
+        models = (small_model, model)
+
     try:
-        tz = pytz.timezone(user_tz)
+        tz = ZoneInfo(user_tz)
         now = datetime.now(tz)
-        day_names = ["lunedi", "martedi", "mercoledi", "giovedi", "venerdi", "sabato", "domenica"]
-        current_day = day_names[now.weekday()]
+        current_day = _DAY_NAMES[now.weekday()]
 
         # Build reminder list
         reminders_text = "Nessun reminder attivo."
@@ -192,62 +355,157 @@ async def classify_and_parse(
             f"Messaggio utente: {text}"
         )
 
-        payload = {
-            "model": model,
-            "messages": [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_message},
-            ],
-            "temperature": 0.1,
-            "max_tokens": 500,
-            "response_format": {"type": "json_object"},
-        }
+        messages = [_SYSTEM_MESSAGE, {"role": "user", "content": user_message}]
+        headers = _auth_headers(api_key)
+
+        # %s-style args are only formatted if the record is actually emitted
+        logger.info("LLM%s: '%s' (%d reminders)",
+                    " [reply-ctx]" if recent_reminder_ctx else "", text[:60],
+                    len(active_reminders or []))
+
+        for attempt_model in models:
+            payload = {"model": attempt_model, "messages": messages, **_PAYLOAD_OPTS}
+            response = await get_http_client().post(GROQ_CHAT_URL, json=payload, headers=headers)
+
+            if response.status_code != 200:
+                logger.error("Groq error %s (%s): %s",
+                             response.status_code, attempt_model, response.text[:200])
+                # 429/5xx look like an outage; 4xx are our own payloads
+                if response.status_code == 429 or response.status_code >= 500:
+                    _breaker_trip()
+                continue
+
+            data = response.json()
+            response_text = data["choices"][0]["message"]["content"].strip()
+            logger.debug("LLM raw response: %s", response_text[:300])
+
+            try:
+                parsed = json.loads(response_text)
+            except json.JSONDecodeError as e:
+                logger.warning("LLM invalid JSON (%s): %s", attempt_model, e)
+                continue
+
+            intent = parsed.get("intent")
+            if not intent:
+                logger.warning("LLM returned no intent (%s)", attempt_model)
+                continue
+
+            if intent == "create":
+                data = parsed.get("data")
+                if not isinstance(data, dict) or not data.get("title"):
+                    # Incomplete parse — retry on the bigger tier if any.
+                    logger.warning("LLM create without title (%s)", attempt_model)
+                    continue
+                if not _validate_create(data):
+                    logger.warning("LLM create failed schema check (%s)", attempt_model)
+                    continue
+                # Fill the category default unless the user asked for an
+                # explicit lead time and the model carried it through.
+                if not data.get("advance_days"):
+                    data["advance_days"] = _ADVANCE_DAYS.get(data.get("category"), 0)
+
+            logger.info("LLM intent=%s (%s)", intent, attempt_model)
+            _breaker_reset()
+            return parsed
 
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-
-        ctx_label = " [reply-ctx]" if recent_reminder_ctx else ""
-        logger.info(f"LLM{ctx_label}: '{text[:60]}' ({len(active_reminders or [])} reminders)")
-
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(GROQ_CHAT_URL, json=payload, headers=headers)
-
-        if response.status_code != 200:
-            logger.error(f"Groq error {response.status_code}: {response.text[:200]}")
-            return None
-
-        data = response.json()
-        response_text = data["choices"][0]["message"]["content"].strip()
-        logger.info(f"LLM response: {response_text[:300]}")
-
-        parsed = json.loads(response_text)
-        intent = parsed.get("intent")
-        if not intent:
-            logger.warning("LLM returned no intent")
-            return None
-
-        logger.info(f"LLM intent={intent}")
-        return parsed
+        return None
 
     except httpx.TimeoutException:
         logger.error("Groq API timeout")
+        _breaker_trip()
         return None
     except json.JSONDecodeError as e:
-        logger.error(f"LLM invalid JSON: {e}")
+        logger.error("LLM invalid JSON: %s", e)
         return None
     except Exception as e:
-        logger.error(f"LLM error: {type(e).__name__}: {e}")
+        logger.error("LLM error: %s: %s", type(e).__name__, e)
+        _breaker_trip()
         return None
 
 
+# Repeated quick phrases ("domani alle 8", "ogni lunedì alle 7") parse to
+# the same thing within the same hour, so identical inputs can skip the
+# Groq round-trip entirely. Keyed by calendar date + hour: parses contain
+# absolute YYYY-MM-DD dates, so an entry must never outlive the day it was
+# computed on. Minute-precision phrases ("tra 10 minuti") are excluded.
+# Only parse_with_llm is cached — classify_and_parse embeds the user's
+# reminder list and reply context, so its answers aren't shareable.
+_PARSE_CACHE: OrderedDict[tuple, dict] = OrderedDict()
+_PARSE_CACHE_MAX = 1024
+_RELATIVE_RE = re.compile(r"\b(?:tra|fra)\b")
+
+# Cache-key normalization: lowercase, fold Italian accents (users type
+# "perche'" and "perché" interchangeably), unify curly quotes, collapse
+# whitespace. translate() is a single C-level pass over the string.
+_NORM_TABLE = str.maketrans({
+    "à": "a", "á": "a", "è": "e", "é": "e", "ì": "i", "í": "i",
+    "ò": "o", "ó": "o", "ù": "u", "ú": "u",
+    "’": "'", "‘": "'", "“": '"', "”": '"', "…": "...",
+})
+
+
+def _norm(text: str) -> str:
+    return " ".join(text.lower().translate(_NORM_TABLE).split())
+
+# Concurrent identical parses (double-taps, templated broadcasts) collapse
+# onto one in-flight Groq call: later arrivals await the first caller's
+# future. No lock needed — the dict is only touched between awaits, and
+# the event loop is single-threaded.
+_INFLIGHT: dict[tuple, asyncio.Future] = {}
+
+
 async def parse_with_llm(text: str, user_tz: str = "Europe/Rome") -> Optional[dict]:
     """Legacy parser for backward compat."""
-    result = await classify_and_parse(text, user_tz, active_reminders=None)
-    if result and result.get("intent") == "create":
-        return result.get("data")
-    return None
+    normalized = _norm(text)
+    key = None
+    future: asyncio.Future | None = None
+    if not _RELATIVE_RE.search(normalized):
+        now = datetime.now(ZoneInfo(user_tz))
+        key = (normalized, user_tz, now.date(), now.hour)
+        cached = _PARSE_CACHE.get(key)
+        if cached is not None:
+            _PARSE_CACHE.move_to_end(key)
+            return cached
+        inflight = _INFLIGHT.get(key)
+        if inflight is not None:
+            return await inflight
+        future = asyncio.get_running_loop().create_future()
+        _INFLIGHT[key] = future
+
+    data = None
+    try:
+        result = await classify_and_parse(text, user_tz, active_reminders=None)
+        data = result.get("data") if result and result.get("intent") == "create" else None
+
+        if key is not None and data is not None:
+            _PARSE_CACHE[key] = data
+            if len(_PARSE_CACHE) > _PARSE_CACHE_MAX:
+                _PARSE_CACHE.popitem(last=False)
+    finally:
+        if future is not None:
+            future.set_result(data)
+            _INFLIGHT.pop(key, None)
+    return data
+
+
+async def parse_many(
+    texts: list[str],
+    user_tz: str = "Europe/Rome",
+    max_concurrency: int = 8,
+) -> list[Optional[dict]]:
+    """Parse a batch of texts concurrently, preserving input order.
+
+    The shared client multiplexes the calls on its keep-alive pool; the
+    semaphore keeps us under Groq's per-key concurrency limit. Duplicate
+    texts in the batch collapse via the single-flight dict.
+    """
+    sem = asyncio.Semaphore(max_concurrency)
+
+    async def _one(text: str) -> Optional[dict]:
+        async with sem:
+            return await parse_with_llm(text, user_tz)
+
+    return list(await asyncio.gather(*(_one(t) for t in texts)))
 
 
 async def transcribe_audio(audio_bytes: bytes, filename: str = "voice.ogg") -> Optional[str]:
@@ -260,18 +518,18 @@ async def transcribe_audio(audio_bytes: bytes, filename: str = "voice.ogg") -> O
         return None
 
     try:
-        logger.info(f"Transcribing ({len(audio_bytes)} bytes) with {whisper_model}")
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                GROQ_AUDIO_URL,
-                headers={"Authorization": f"Bearer {api_key}"},
-                files={"file": (filename, audio_bytes, "audio/ogg")},
-                data={"model": whisper_model, "language": "it", "response_format": "json"},
-            )
+        logger.info("Transcribing (%d bytes) with %s", len(audio_bytes), whisper_model)
+
+        response = await get_http_client().post(
+            GROQ_AUDIO_URL,
+            headers={"Authorization": f"Bearer {api_key}"},
+            files={"file": (filename, audio_bytes, "audio/ogg")},
+            data={"model": whisper_model, "language": "it", "response_format": "json"},
+            timeout=30.0,
+        )
 
         if response.status_code != 200:
-            logger.error(f"Whisper error {response.status_code}: {response.text[:200]}")
+            logger.error("Whisper error %s: %s", response.status_code, response.text[:200])
             return None
 
         text = response.json().get("text", "").strip()
@@ -279,12 +537,12 @@ async def transcribe_audio(audio_bytes: bytes, filename: str = "voice.ogg") -> O
             logger.warning("Whisper returned empty transcription")
             return None
 
-        logger.info(f"Transcription: '{text[:100]}'")
+        logger.info("Transcription: '%s'", text[:100])
         return text
 
     except httpx.TimeoutException:
         logger.error("Whisper timeout")
         return None
     except Exception as e:
-        logger.error(f"Whisper error: {type(e).__name__}: {e}")
+        logger.error("Whisper error: %s: %s", type(e).__name__, e)
         return None
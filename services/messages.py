@@ -1,27 +1,31 @@
 """
 All bot message templates.
 """
+from functools import lru_cache
+
 from database import Reminder, ReminderCategory
 
 
 # --- Emoji map ---
-EMOJI = {
-    ReminderCategory.MEDICINE: "💊",
-    ReminderCategory.BIRTHDAY: "🎂",
-    ReminderCategory.CAR: "🚗",
-    ReminderCategory.HOUSE: "🏠",
-    ReminderCategory.HEALTH: "🩺",
-    ReminderCategory.DOCUMENT: "📄",
-    ReminderCategory.HABIT: "💧",
-    ReminderCategory.GENERIC: "📌",
+# Keyed by the enum's string value: lookups are a single dict.get with no
+# enum construction (ReminderCategory(x) raises on miss, which is costly
+# in the per-notification render path).
+EMOJI: dict[str, str] = {
+    ReminderCategory.MEDICINE.value: "💊",
+    ReminderCategory.BIRTHDAY.value: "🎂",
+    ReminderCategory.CAR.value: "🚗",
+    ReminderCategory.HOUSE.value: "🏠",
+    ReminderCategory.HEALTH.value: "🩺",
+    ReminderCategory.DOCUMENT.value: "📄",
+    ReminderCategory.HABIT.value: "💧",
+    ReminderCategory.GENERIC.value: "📌",
 }
 
 
-def get_emoji(category: str) -> str:
-    try:
-        return EMOJI[ReminderCategory(category)]
-    except (ValueError, KeyError):
-        return "📌"
+def get_emoji(category: ReminderCategory | str) -> str:
+    if isinstance(category, ReminderCategory):
+        category = category.value
+    return EMOJI.get(category, "📌")
 
 
 # --- Welcome messages ---
@@ -81,41 +85,58 @@ MEDICINE_ASK_DURATION = "Per quanti giorni devi prenderlo?"
 MEDICINE_ADDED = "✅ Ti ricorderò ogni volta e non mollo finché non confermi 😄\n\nVuoi aggiungere un altro farmaco?"
 
 # --- Reminder nudges ---
+# A recurring reminder renders the exact same nudge texts for weeks, so
+# the render is a memoized pure function of the fields; nudge_1/quick/2/3
+# are thin wrappers that pull those fields off the ORM object.
+
+@lru_cache(maxsize=2048)
+def _render_nudge(stage: int, category: str, title: str, slot: int, total: int) -> str:
+    is_medicine = category == ReminderCategory.MEDICINE.value
+    if stage == 1:
+        if is_medicine and total:
+            suffix = " — ultimo di oggi 👏" if slot == total else ""
+            return f"{get_emoji(category)} *{title}* ({slot}/{total}){suffix}"
+        return f"🔔 *{title}*"
+    lower = title.lower()
+    if stage == 0:  # quick 5-minute followup
+        if is_medicine:
+            return f"{get_emoji(category)} _{lower}_ — l'hai presa?"
+        return f"⏳ _{lower}_ — ci stai pensando?"
+    if stage == 2:
+        if is_medicine:
+            return f"{get_emoji(category)} _Ehi, {lower}?_"
+        return f"👀 _Ehi, {lower}?_"
+    if is_medicine:
+        return f"💊 _Ultimo reminder per {lower}. Saltata?_"
+    return f"🫠 _Ultimo nudge per oggi: {lower}. Lo sposto a domani?_"
+
+
+def _nudge_fields(reminder: Reminder) -> tuple[str, str, int, int]:
+    category = reminder.category
+    if isinstance(category, ReminderCategory):
+        category = category.value
+    return (category, reminder.title,
+            (reminder.time_slot_index or 0) + 1, reminder.time_slot_total or 0)
+
 
 def nudge_1(reminder: Reminder) -> str:
     """First notification when reminder fires."""
-    emoji = get_emoji(reminder.category)
-    if reminder.category == ReminderCategory.MEDICINE and reminder.time_slot_total:
-        slot = (reminder.time_slot_index or 0) + 1
-        total = reminder.time_slot_total
-        suffix = ""
-        if slot == total:
-            suffix = " — ultimo di oggi 👏"
-        return f"{emoji} *{reminder.title}* ({slot}/{total}){suffix}"
-    return f"🔔 *{reminder.title}*"
+    return _render_nudge(1, *_nudge_fields(reminder))
 
 
 def nudge_quick(reminder: Reminder) -> str:
     """Quick 5-minute gentle followup."""
-    emoji = get_emoji(reminder.category)
-    if reminder.category == ReminderCategory.MEDICINE:
-        return f"{emoji} _{reminder.title.lower()}_ — l'hai presa?"
-    return f"⏳ _{reminder.title.lower()}_ — ci stai pensando?"
+    return _render_nudge(0, *_nudge_fields(reminder))
 
 
 def nudge_2(reminder: Reminder) -> str:
     """Second nudge (30 min after first)."""
-    emoji = get_emoji(reminder.category)
-    if reminder.category == ReminderCategory.MEDICINE:
-        return f"{emoji} _Ehi, {reminder.title.lower()}?_"
-    return f"👀 _Ehi, {reminder.title.lower()}?_"
+    return _render_nudge(2, *_nudge_fields(reminder))
 
 
 def nudge_3(reminder: Reminder) -> str:
     """Third and final nudge."""
-    if reminder.category == ReminderCategory.MEDICINE:
-        return f"💊 _Ultimo reminder per {reminder.title.lower()}. Saltata?_"
-    return f"🫠 _Ultimo nudge per oggi: {reminder.title.lower()}. Lo sposto a domani?_"
+    return _render_nudge(3, *_nudge_fields(reminder))
 
 
 def snooze_warning(reminder: Reminder) -> str:
@@ -156,6 +177,28 @@ def morning_summary(items: list[dict]) -> str:
     return "\n".join(lines)
 
 
+def morning_summary_many(users_items: dict[int, list[dict]]) -> dict[int, str]:
+    """Render morning summaries for a batch of users at once.
+
+    Users on the same recurring schedule (common for habit and medicine
+    plans) produce byte-identical summaries, so each distinct item list
+    is rendered once and shared. The memo lives per call — no staleness
+    to manage across days.
+    """
+    rendered: dict[tuple, str] = {}
+    out: dict[int, str] = {}
+    for user_id, items in users_items.items():
+        key = tuple(
+            (i["title"], str(i["category"]), tuple(i.get("times") or ()), i.get("note"))
+            for i in items
+        )
+        text = rendered.get(key)
+        if text is None:
+            text = rendered[key] = morning_summary(items)
+        out[user_id] = text
+    return out
+
+
 # --- Weekly summary ---
 
 def weekly_summary(done: int, snoozed: int, cancelled: int,
@@ -10,14 +10,57 @@ Two parsing modes:
 import re
 import logging
 from datetime import datetime, timedelta, time
+from functools import lru_cache
 from typing import Optional
 import dateparser
-import pytz
+from zoneinfo import ZoneInfo
 
 from database import ReminderCategory, RecurrenceType
+from services.messages import get_emoji
 
 logger = logging.getLogger(__name__)
 
+_DAY_LABELS = {
+    "mon": "lunedì", "tue": "martedì", "wed": "mercoledì",
+    "thu": "giovedì", "fri": "venerdì", "sat": "sabato", "sun": "domenica",
+}
+
+
+# Per-recurrence date/time lines for summary_lines, dispatched by enum
+# instead of walking an if/elif chain per confirmation.
+
+def _once_lines(p: "ParsedReminder") -> list[str]:
+    dt = p.fire_datetime
+    return [f"🗓 {dt.strftime('%d/%m/%Y')} ore {dt.strftime('%H:%M')}"]
+
+
+def _daily_lines(p: "ParsedReminder") -> list[str]:
+    if p.fire_times:
+        return ["🗓 Ogni giorno", f"⏰ {' · '.join(p.fire_times)}"]
+    return [f"🗓 Ogni giorno ore {p.fire_datetime.strftime('%H:%M')}"]
+
+
+def _weekly_lines(p: "ParsedReminder") -> list[str]:
+    if not p.recurrence_days:
+        return []
+    days = ", ".join(_DAY_LABELS.get(d, d) for d in p.recurrence_days.split(","))
+    if p.fire_times:
+        return [f"🗓 Ogni {days}", f"⏰ {' · '.join(p.fire_times)}"]
+    return [f"🗓 Ogni {days} ore {p.fire_datetime.strftime('%H:%M')}"]
+
+
+def _monthly_lines(p: "ParsedReminder") -> list[str]:
+    dt = p.fire_datetime
+    return [f"🗓 Ogni mese il {dt.day} ore {dt.strftime('%H:%M')}"]
+
+
+_REC_FORMATTERS = {
+    RecurrenceType.ONCE: _once_lines,
+    RecurrenceType.DAILY: _daily_lines,
+    RecurrenceType.WEEKLY: _weekly_lines,
+    RecurrenceType.MONTHLY: _monthly_lines,
+}
+
 
 class ParsedReminder:
     def __init__(self):
@@ -32,59 +75,21 @@ class ParsedReminder:
 
     def summary_lines(self) -> list[str]:
         """Generate confirmation message lines."""
-        lines = []
-
-        # Category emoji
-        emoji_map = {
-            ReminderCategory.MEDICINE: "💊",
-            ReminderCategory.BIRTHDAY: "🎂",
-            ReminderCategory.CAR: "🚗",
-            ReminderCategory.HOUSE: "🏠",
-            ReminderCategory.HEALTH: "🩺",
-            ReminderCategory.DOCUMENT: "📄",
-            ReminderCategory.HABIT: "💧",
-            ReminderCategory.GENERIC: "📌",
-        }
-        emoji = emoji_map.get(self.category, "📌")
-        lines.append(f"{emoji} {self.title}")
+        lines = [f"{get_emoji(self.category)} {self.title}"]
 
         # Date/time
         if self.fire_datetime:
-            if self.recurrence == RecurrenceType.ONCE:
-                dt = self.fire_datetime
-                lines.append(f"🗓 {dt.strftime('%d/%m/%Y')} ore {dt.strftime('%H:%M')}")
-            elif self.recurrence == RecurrenceType.DAILY:
-                if self.fire_times:
-                    times_str = " · ".join(self.fire_times)
-                    lines.append(f"🗓 Ogni giorno")
-                    lines.append(f"⏰ {times_str}")
-                else:
-                    lines.append(f"🗓 Ogni giorno ore {self.fire_datetime.strftime('%H:%M')}")
-            elif self.recurrence == RecurrenceType.WEEKLY:
-                day_names = {
-                    "mon": "lunedì", "tue": "martedì", "wed": "mercoledì",
-                    "thu": "giovedì", "fri": "venerdì", "sat": "sabato", "sun": "domenica"
-                }
-                if self.recurrence_days:
-                    days = [day_names.get(d, d) for d in self.recurrence_days.split(",")]
-                    time_str = self.fire_datetime.strftime('%H:%M') if self.fire_datetime else ""
-                    if self.fire_times:
-                        times_display = " · ".join(self.fire_times)
-                        lines.append(f"🗓 Ogni {', '.join(days)}")
-                        lines.append(f"⏰ {times_display}")
-                    else:
-                        lines.append(f"🗓 Ogni {', '.join(days)} ore {time_str}")
-            elif self.recurrence == RecurrenceType.MONTHLY:
-                lines.append(f"🗓 Ogni mese il {self.fire_datetime.day} ore {self.fire_datetime.strftime('%H:%M')}")
+            formatter = _REC_FORMATTERS.get(self.recurrence)
+            if formatter:
+                lines += formatter(self)
 
         # Recurrence label
         if self.recurrence == RecurrenceType.ONCE:
             lines.append("🔁 Una tantum")
+        elif self.end_date:
+            lines.append(f"⏳ Fino al {self.end_date.strftime('%d/%m/%Y')}")
         else:
-            if self.end_date:
-                lines.append(f"⏳ Fino al {self.end_date.strftime('%d/%m/%Y')}")
-            else:
-                lines.append("🔁 Ricorrente (senza scadenza)")
+            lines.append("🔁 Ricorrente (senza scadenza)")
 
         return lines
 
@@ -96,7 +101,7 @@ class ParsedReminder:
 def _llm_dict_to_parsed(data: dict, user_tz: str = "Europe/Rome") -> ParsedReminder:
     """Convert LLM JSON output to a ParsedReminder object."""
     result = ParsedReminder()
-    tz = pytz.timezone(user_tz)
+    tz = ZoneInfo(user_tz)
     now = datetime.now(tz)
 
     # Title
@@ -130,8 +135,9 @@ def _llm_dict_to_parsed(data: dict, user_tz: str = "Europe/Rome") -> ParsedRemin
     fire_dt = None
     if date_str:
         try:
-            fire_dt = datetime.strptime(date_str, "%Y-%m-%d")
-            fire_dt = tz.localize(fire_dt)
+            # fromisoformat is a C fast path; strptime re-parses the
+            # format string on every call.
+            fire_dt = datetime.fromisoformat(date_str).replace(tzinfo=tz)
         except ValueError:
             fire_dt = None
 
@@ -169,8 +175,7 @@ def _llm_dict_to_parsed(data: dict, user_tz: str = "Europe/Rome") -> ParsedRemin
     end_date_str = data.get("end_date")
     if end_date_str:
         try:
-            ed = datetime.strptime(end_date_str, "%Y-%m-%d")
-            result.end_date = tz.localize(ed)
+            result.end_date = datetime.fromisoformat(end_date_str).replace(tzinfo=tz)
         except ValueError:
             pass
 
@@ -184,8 +189,32 @@ def _llm_dict_to_parsed(data: dict, user_tz: str = "Europe/Rome") -> ParsedRemin
 # Async parser: LLM first, regex fallback
 # ─────────────────────────────────────────────
 
+# Inputs with an unambiguous day anchor AND an explicit time are exactly
+# what the regex parser handles deterministically — for those the 1-3s
+# Groq round-trip adds nothing, so they skip the LLM entirely. Anything
+# fuzzier ("dopo pranzo", "verso le dieci") still goes to the LLM first.
+_FAST_DAY_RE = re.compile(
+    r"\b(?:domani|dopodomani|oggi|stasera|stamattina"
+    r"|ogni\s+(?:giorno|mattina|sera|mese|lunedì|martedì|mercoledì|giovedì|venerdì|sabato|domenica)"
+    r"|tutti\s+i\s+giorni|a\s+giorni\s+alterni)\b"
+)
+_FAST_TIME_RE = re.compile(
+    r"(?:\balle?\s+\d{1,2}(?:[:\.]\d{2})?\b|\btra\s+\d+\s*(?:or[ae]|minut[oi]|min|h)\b)"
+)
+
+
 async def parse_reminder_async(text: str, user_tz: str = "Europe/Rome") -> ParsedReminder:
     """Parse with LLM first, fallback to regex."""
+    lower = text.lower()
+    if _FAST_DAY_RE.search(lower) and _FAST_TIME_RE.search(lower):
+        parsed = parse_reminder(text, user_tz)
+        # Only trust the fast path when it actually extracted an action:
+        # an unchanged title means the fragments didn't strip cleanly.
+        if parsed.title and parsed.fire_datetime and parsed.title.lower() != lower.strip():
+            logger.info("Fast-path regex parse hit (LLM skipped)")
+            return parsed
+        logger.info("Fast-path regex parse miss, deferring to LLM")
+
     try:
         from services.llm import parse_with_llm
         llm_result = await parse_with_llm(text, user_tz)
@@ -203,10 +232,98 @@ async def parse_reminder_async(text: str, user_tz: str = "Europe/Rome") -> Parse
 # Regex parser (offline fallback)
 # ─────────────────────────────────────────────
 
+# All patterns compiled once at import: parse_reminder runs on every
+# Telegram message, and per-call re.sub/re.search pay a cache probe and
+# compile check each time. Sequential single-pattern passes are folded
+# into single alternations where only one branch can match.
+_PREFIX_RE = re.compile(r"^(?:ricorda(?:mi)?\s+(?:di\s+)?|reminder\s+|promemoria\s+)")
+_MULTI_TIME_RE = re.compile(
+    r"alle?\s+(\d{1,2}(?:[:\.]\d{2})?(?:\s*[,e]\s*\d{1,2}(?:[:\.]\d{2})?)+)"
+)
+_TIME_SPLIT_RE = re.compile(r"\s*[,e]\s*")
+_RECURRENCE_TABLE = [
+    (re.compile(p), rec, days) for p, rec, days in (
+        (r"ogni\s+giorno", RecurrenceType.DAILY, None),
+        (r"tutti\s+i\s+giorni", RecurrenceType.DAILY, None),
+        (r"ogni\s+mattina", RecurrenceType.DAILY, None),
+        (r"ogni\s+sera", RecurrenceType.DAILY, None),
+        (r"ogni\s+lunedì", RecurrenceType.WEEKLY, "mon"),
+        (r"ogni\s+martedì", RecurrenceType.WEEKLY, "tue"),
+        (r"ogni\s+mercoledì", RecurrenceType.WEEKLY, "wed"),
+        (r"ogni\s+giovedì", RecurrenceType.WEEKLY, "thu"),
+        (r"ogni\s+venerdì", RecurrenceType.WEEKLY, "fri"),
+        (r"ogni\s+sabato", RecurrenceType.WEEKLY, "sat"),
+        (r"ogni\s+domenica", RecurrenceType.WEEKLY, "sun"),
+        (r"ogni\s+mese", RecurrenceType.MONTHLY, None),
+        (r"il\s+\d+\s+di\s+ogni\s+mese", RecurrenceType.MONTHLY, None),
+        (r"a\s+giorni\s+alterni", RecurrenceType.EVERY_OTHER_DAY, None),
+    )
+]
+_TRA_RE = re.compile(r"tra\s+(\d+)\s*(or[ae]|minut[oi]|min|h)")
+_TIME_HM_RE = re.compile(r"(?:alle?\s+)?(\d{1,2})[:\.:](\d{2})")
+_SINGLE_TIME_RE = re.compile(r"alle?\s+(\d{1,2})(?!\d)")
+# One alternation over all time fragments: a single pass replaces the
+# old per-fragment sub loop over the same shrinking string.
+_TITLE_CLEANUP_RE = re.compile(
+    r"(?:alle?\s+\d{1,2}(?:[:\.]\d{2})?"
+    r"|(?:dopo)?domani\s*(?:mattina|pomeriggio|sera)?"
+    r"|oggi\s*(?:mattina|pomeriggio|sera)?"
+    r"|stasera|stamattina"
+    r"|(?:lunedì|martedì|mercoledì|giovedì|venerdì|sabato|domenica)\s*(?:mattina|sera|pomeriggio)?"
+    r"|tra\s+\d+\s*(?:or[ae]|minut[oi]|min|h)"
+    # the trailing word must not be another cleanup fragment ("il 5 di
+    # ogni mese alle 9": eating "alle" here would strand the "9")
+    r"|il\s+\d+\s*(?:di\s+)?(?!alle?\b|dalle\b)\w*"
+    r"|mattina|pomeriggio|sera)"
+)
+_WS_RE = re.compile(r"\s+")
+# The settings dict only varies by timezone — one per tz, built once.
+@lru_cache(maxsize=64)
+def _dateparser_settings(user_tz: str) -> dict:
+    return {
+        "PREFER_DATES_FROM": "future",
+        "TIMEZONE": user_tz,
+        "RETURN_AS_TIMEZONE_AWARE": True,
+        "PARSERS": ["relative-time", "absolute-time", "custom-formats"],
+    }
+
+
+# Inputs with no date-bearing token at all ("bere acqua") don't need
+# dateparser's full tokenizer pass — gate the call on this.
+_HAS_TEMPORAL_RE = re.compile(
+    r"\b(?:doman|oggi|stasera|stamattina|settiman|prossim"
+    r"|lunedì|martedì|mercoledì|giovedì|venerdì|sabato|domenica"
+    r"|gennaio|febbraio|marzo|aprile|maggio|giugno|luglio"
+    r"|agosto|settembre|ottobre|novembre|dicembre)"
+    r"|\d{1,2}[:./-]\d|\balle?\s+\d"
+)
+
+# Category keywords fused into one alternation with a named group per
+# category: one linear scan of the input instead of ~50 substring
+# searches. All matches are collected and the winner picked by the
+# table's order, preserving the old first-category-wins priority.
+_CAT_KEYWORDS = {
+    ReminderCategory.MEDICINE: ["farmaco", "medicina", "pillola", "pastiglia", "integratore",
+                                "vitamina", "antibiotico", "compressa", "dose"],
+    ReminderCategory.BIRTHDAY: ["compleanno", "auguri"],
+    ReminderCategory.CAR: ["bollo", "tagliando", "assicurazione auto", "revisione", "benzina"],
+    ReminderCategory.HOUSE: ["affitto", "bolletta", "condominio", "luce", "gas", "acqua"],
+    ReminderCategory.HEALTH: ["dentista", "dottore", "medico", "visita", "analisi", "esame"],
+    ReminderCategory.DOCUMENT: ["carta d'identità", "passaporto", "patente", "documenti", "730", "isee"],
+    ReminderCategory.HABIT: ["bere acqua", "acqua", "meditare", "camminare", "palestra",
+                             "stretching", "leggere"],
+}
+_CAT_PRIORITY = tuple(_CAT_KEYWORDS)
+_CAT_RE = re.compile("|".join(
+    "(?P<%s>%s)" % (cat.name, "|".join(map(re.escape, keywords)))
+    for cat, keywords in _CAT_KEYWORDS.items()
+))
+
+
 def parse_reminder(text: str, user_tz: str = "Europe/Rome") -> ParsedReminder:
     """Parse free-text Italian input into a structured reminder."""
     result = ParsedReminder()
-    tz = pytz.timezone(user_tz)
+    tz = ZoneInfo(user_tz)
     now = datetime.now(tz)
 
     # Normalize
@@ -214,22 +331,13 @@ def parse_reminder(text: str, user_tz: str = "Europe/Rome") -> ParsedReminder:
     lower = original.lower()
 
     # --- Remove common prefixes ---
-    prefixes = [
-        r"^ricordami\s+(di\s+)?", r"^ricorda(mi)?\s+(di\s+)?",
-        r"^reminder\s+", r"^promemoria\s+",
-    ]
-    cleaned = lower
-    for p in prefixes:
-        cleaned = re.sub(p, "", cleaned, count=1)
+    cleaned = _PREFIX_RE.sub("", lower, count=1)
 
     # --- Detect multiple times (e.g., "alle 10, 13, 16 e 19") ---
-    multi_time_match = re.search(
-        r"alle?\s+(\d{1,2}(?:[:\.]\d{2})?(?:\s*[,e]\s*\d{1,2}(?:[:\.]\d{2})?)+)",
-        cleaned
-    )
+    multi_time_match = _MULTI_TIME_RE.search(cleaned)
     if multi_time_match:
         times_str = multi_time_match.group(1)
-        times_raw = re.split(r"\s*[,e]\s*", times_str)
+        times_raw = _TIME_SPLIT_RE.split(times_str)
         for t in times_raw:
             t = t.strip().replace(".", ":")
             if ":" not in t:
@@ -243,33 +351,16 @@ def parse_reminder(text: str, user_tz: str = "Europe/Rome") -> ParsedReminder:
         result.recurrence = RecurrenceType.DAILY
 
     # --- Detect recurrence ---
-    recurrence_patterns = [
-        (r"ogni\s+giorno", RecurrenceType.DAILY, None),
-        (r"tutti\s+i\s+giorni", RecurrenceType.DAILY, None),
-        (r"ogni\s+mattina", RecurrenceType.DAILY, None),
-        (r"ogni\s+sera", RecurrenceType.DAILY, None),
-        (r"ogni\s+lunedì", RecurrenceType.WEEKLY, "mon"),
-        (r"ogni\s+martedì", RecurrenceType.WEEKLY, "tue"),
-        (r"ogni\s+mercoledì", RecurrenceType.WEEKLY, "wed"),
-        (r"ogni\s+giovedì", RecurrenceType.WEEKLY, "thu"),
-        (r"ogni\s+venerdì", RecurrenceType.WEEKLY, "fri"),
-        (r"ogni\s+sabato", RecurrenceType.WEEKLY, "sat"),
-        (r"ogni\s+domenica", RecurrenceType.WEEKLY, "sun"),
-        (r"ogni\s+mese", RecurrenceType.MONTHLY, None),
-        (r"il\s+\d+\s+di\s+ogni\s+mese", RecurrenceType.MONTHLY, None),
-        (r"a\s+giorni\s+alterni", RecurrenceType.EVERY_OTHER_DAY, None),
-    ]
-
-    for pattern, rec_type, days in recurrence_patterns:
-        if re.search(pattern, cleaned):
+    for pattern, rec_type, days in _RECURRENCE_TABLE:
+        if pattern.search(cleaned):
             result.recurrence = rec_type
             if days:
                 result.recurrence_days = days
-            cleaned = re.sub(pattern, "", cleaned).strip()
+            cleaned = pattern.sub("", cleaned).strip()
             break
 
     # --- Detect "tra X ore/minuti" ---
-    tra_match = re.search(r"tra\s+(\d+)\s*(or[ae]|minut[oi]|min|h)", cleaned)
+    tra_match = _TRA_RE.search(cleaned)
     if tra_match:
         amount = int(tra_match.group(1))
         unit = tra_match.group(2)
@@ -281,30 +372,53 @@ def parse_reminder(text: str, user_tz: str = "Europe/Rome") -> ParsedReminder:
 
     # --- Use dateparser for date/time extraction ---
     if not result.fire_datetime:
-        settings = {
-            "PREFER_DATES_FROM": "future",
-            "TIMEZONE": user_tz,
-            "RETURN_AS_TIMEZONE_AWARE": True,
-            "PARSERS": ["relative-time", "absolute-time", "custom-formats"],
-        }
-
-        time_match = re.search(r"(?:alle?\s+)?(\d{1,2})[:\.:](\d{2})", cleaned)
-        single_time_match = re.search(r"alle?\s+(\d{1,2})(?!\d)", cleaned)
-
-        parsed_date = dateparser.parse(cleaned, languages=["it"], settings=settings)
+        time_match = _TIME_HM_RE.search(cleaned)
+        single_time_match = _SINGLE_TIME_RE.search(cleaned)
+
+        # Explicit day anchor — dateparser can miss it when the sentence
+        # has trailing words, so honor it in the time-only fallbacks too.
+        anchored = True
+        if "dopodomani" in cleaned:
+            day_offset = 2
+        elif "domani" in cleaned:
+            day_offset = 1
+        elif "oggi" in cleaned or "stasera" in cleaned or "stamattina" in cleaned:
+            day_offset = 0
+        else:
+            anchored = False
+            day_offset = 0
+
+        if anchored and (time_match or single_time_match):
+            # Anchored day + explicit time is fully deterministic: build
+            # the datetime directly, skipping dateparser's heuristics.
+            if time_match:
+                h, m = int(time_match.group(1)), int(time_match.group(2))
+            else:
+                h, m = int(single_time_match.group(1)), 0
+            parsed_date = (now + timedelta(days=day_offset)).replace(
+                hour=h, minute=m, second=0, microsecond=0
+            )
+            if day_offset == 0 and parsed_date <= now:
+                parsed_date += timedelta(days=1)
+        elif _HAS_TEMPORAL_RE.search(cleaned):
+            parsed_date = dateparser.parse(
+                cleaned, languages=["it"], settings=_dateparser_settings(user_tz)
+            )
+        else:
+            parsed_date = None
 
         if parsed_date:
             result.fire_datetime = parsed_date
         elif time_match:
             h, m = int(time_match.group(1)), int(time_match.group(2))
-            target = now.replace(hour=h, minute=m, second=0, microsecond=0)
-            if target <= now:
+            target = (now + timedelta(days=day_offset)).replace(hour=h, minute=m, second=0, microsecond=0)
+            if day_offset == 0 and target <= now:
                 target += timedelta(days=1)
             result.fire_datetime = target
         elif single_time_match:
             h = int(single_time_match.group(1))
-            target = now.replace(hour=h, minute=0, second=0, microsecond=0)
-            if target <= now:
+            target = (now + timedelta(days=day_offset)).replace(hour=h, minute=0, second=0, microsecond=0)
+            if day_offset == 0 and target <= now:
                 target += timedelta(days=1)
             result.fire_datetime = target
 
@@ -319,21 +433,8 @@ def parse_reminder(text: str, user_tz: str = "Europe/Rome") -> ParsedReminder:
         result.fire_datetime = result.fire_datetime.replace(hour=h, minute=m, second=0)
 
     # --- Extract title ---
-    title = cleaned
-    time_fragments = [
-        r"alle?\s+\d{1,2}([:\.]\d{2})?",
-        r"domani\s*(mattina|pomeriggio|sera)?",
-        r"oggi\s*(mattina|pomeriggio|sera)?",
-        r"stasera", r"stamattina",
-        r"(lunedì|martedì|mercoledì|giovedì|venerdì|sabato|domenica)\s*(mattina|sera|pomeriggio)?",
-        r"tra\s+\d+\s*(or[ae]|minut[oi]|min|h)",
-        r"il\s+\d+\s*(di\s+)?\w*",
-        r"(mattina|pomeriggio|sera)",
-    ]
-    for frag in time_fragments:
-        title = re.sub(frag, "", title).strip()
-
-    title = re.sub(r"\s+", " ", title).strip(" ,.-")
+    title = _TITLE_CLEANUP_RE.sub("", cleaned)
+    title = _WS_RE.sub(" ", title).strip(" ,.-")
 
     if title:
         title = title[0].upper() + title[1:]
@@ -341,21 +442,12 @@ def parse_reminder(text: str, user_tz: str = "Europe/Rome") -> ParsedReminder:
     result.title = title or original
 
     # --- Detect category ---
-    cat_keywords = {
-        ReminderCategory.MEDICINE: ["farmaco", "medicina", "pillola", "pastiglia", "integratore",
-                                     "vitamina", "antibiotico", "compressa", "dose"],
-        ReminderCategory.BIRTHDAY: ["compleanno", "auguri"],
-        ReminderCategory.CAR: ["bollo", "tagliando", "assicurazione auto", "revisione", "benzina"],
-        ReminderCategory.HOUSE: ["affitto", "bolletta", "condominio", "luce", "gas", "acqua"],
-        ReminderCategory.HEALTH: ["dentista", "dottore", "medico", "visita", "analisi", "esame"],
-        ReminderCategory.DOCUMENT: ["carta d'identità", "passaporto", "patente", "documenti", "730", "isee"],
-        ReminderCategory.HABIT: ["bere acqua", "acqua", "meditare", "camminare", "palestra",
-                                  "stretching", "leggere"],
-    }
-    for cat, keywords in cat_keywords.items():
-        if any(kw in lower for kw in keywords):
-            result.category = cat
-            break
+    matched = {m.lastgroup for m in _CAT_RE.finditer(lower)}
+    if matched:
+        for cat in _CAT_PRIORITY:
+            if cat.name in matched:
+                result.category = cat
+                break
 
     return result
 
@@ -1,16 +1,17 @@
 """
 APScheduler-based reminder and nudge delivery service.
 """
+import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from sqlalchemy import select, and_
-import pytz
+from sqlalchemy import select, and_, or_
+from zoneinfo import ZoneInfo
 
-from database import async_session, Reminder, User, ReminderLog, ReminderStatus, RecurrenceType, ReminderCategory
+from database import async_session, utcnow, Reminder, User, ReminderLog, ReminderStatus, RecurrenceType, ReminderCategory
 from services.messages import (
-    nudge_1, nudge_quick, nudge_2, nudge_3, morning_summary, weekly_summary,
+    nudge_1, nudge_quick, nudge_2, nudge_3, morning_summary_many, weekly_summary,
     get_emoji, snooze_warning
 )
 from config import NUDGE_1_FOLLOWUP, NUDGE_2_DELAY, NUDGE_3_DELAY, MEDICINE_NUDGE_DELAY, MAX_NUDGES
@@ -24,6 +25,51 @@ _bot = None
 # Used for contextual replies (user responds to a reminder with text/voice)
 last_sent_reminders: dict[int, dict] = {}
 
+# Per-batch send parallelism: overlapping the Telegram round-trips beats
+# awaiting them one by one, while the bound (plus the app-level rate
+# limiter) keeps bursts under the ~30 msg/s bot-wide cap.
+_SEND_CONCURRENCY = 10
+
+
+def _local_now(now_utc: datetime, tz_name: str | None, cache: dict) -> datetime:
+    """Convert the tick's UTC instant to a user's local time, memoized.
+
+    Jobs iterate many users but only a handful of distinct timezones, so
+    one astimezone per zone per tick replaces a datetime.now(tz) call per
+    row — and every row in the batch sees the same clock reading.
+    """
+    tz_name = tz_name or "Europe/Rome"
+    local = cache.get(tz_name)
+    if local is None:
+        local = cache[tz_name] = now_utc.astimezone(ZoneInfo(tz_name))
+    return local
+
+
+async def _send_nudge_message(sem, reminder, user_id, text, keyboard, now_utc) -> bool:
+    """Send one nudge and record its delivery state; False on failure."""
+    try:
+        async with sem:
+            await _bot.send_message(
+                chat_id=user_id,
+                text=text,
+                parse_mode="Markdown",
+                reply_markup=keyboard,
+            )
+    except Exception as e:
+        logger.error(f"Failed to send nudge for {reminder.id}: {e}")
+        return False
+
+    # Plain attribute writes — no session I/O, safe under gather.
+    reminder.nudge_count += 1
+    reminder.last_nudge_at = now_utc
+    last_sent_reminders[reminder.user_id] = {
+        "reminder_id": reminder.id,
+        "title": reminder.title,
+        "category": reminder.category,
+        "sent_at": now_utc,
+    }
+    return True
+
 
 def init_scheduler(bot):
     """Initialize scheduler with bot reference."""
@@ -55,53 +101,42 @@ async def check_reminders():
     if not _bot:
         return
 
-    now_utc = datetime.utcnow()
+    now_utc = utcnow()
 
     async with async_session() as session:
-        stmt = select(Reminder).join(User).where(
+        # Select the joined User row too — re-fetching it per reminder
+        # with session.get was an extra round-trip apiece.
+        stmt = select(Reminder, User).join(User).where(
             and_(
                 Reminder.status == ReminderStatus.ACTIVE,
                 Reminder.next_fire <= now_utc,
                 Reminder.nudge_count == 0,
+                # /silenzio: filter silenced users in SQL, not per-nudge
+                or_(User.silent_until.is_(None), User.silent_until < now_utc),
             )
         )
         result = await session.execute(stmt)
-        reminders = result.scalars().all()
-
-        for reminder in reminders:
-            user = await session.get(User, reminder.user_id)
-            if not user:
-                continue
 
+        sem = asyncio.Semaphore(_SEND_CONCURRENCY)
+        tasks = []
+        local_now_by_tz: dict[str, datetime] = {}
+        for reminder, user in result.all():
             # Check DND hours
-            tz = pytz.timezone(user.timezone or "Europe/Rome")
-            local_now = datetime.now(tz)
+            local_now = _local_now(now_utc, user.timezone, local_now_by_tz)
             if local_now.hour >= user.sleep_hour or local_now.hour < user.wake_hour:
                 continue  # Skip, will be included in morning summary
 
-            # Send nudge 1
-            text = nudge_1(reminder)
-            keyboard = _get_reminder_keyboard(reminder)
+            # Send nudge 1 — gathered so the Telegram round-trips overlap
+            tasks.append(_send_nudge_message(
+                sem, reminder, user.id,
+                nudge_1(reminder), _get_reminder_keyboard(reminder), now_utc,
+            ))
 
-            try:
-                await _bot.send_message(
-                    chat_id=user.chat_id,
-                    text=text,
-                    parse_mode="Markdown",
-                    reply_markup=keyboard,
-                )
-                reminder.nudge_count = 1
-                reminder.last_nudge_at = now_utc
-                # Track for contextual text/voice replies
-                last_sent_reminders[reminder.user_id] = {
-                    "reminder_id": reminder.id,
-                    "title": reminder.title,
-                    "category": reminder.category,
-                    "sent_at": now_utc,
-                }
-                await session.commit()
-            except Exception as e:
-                logger.error(f"Failed to send reminder {reminder.id}: {e}")
+        # One commit for the whole batch — a per-reminder commit paid a
+        # full fsync round-trip apiece. Failed sends left no ORM changes,
+        # so committing the successes together is safe.
+        if tasks and any(await asyncio.gather(*tasks)):
+            await session.commit()
 
 
 async def check_nudges():
@@ -109,28 +144,26 @@ async def check_nudges():
     if not _bot:
         return
 
-    now_utc = datetime.utcnow()
+    now_utc = utcnow()
 
     async with async_session() as session:
-        stmt = select(Reminder).join(User).where(
+        stmt = select(Reminder, User).join(User).where(
             and_(
                 Reminder.status == ReminderStatus.ACTIVE,
                 Reminder.nudge_count >= 1,
                 Reminder.nudge_count < MAX_NUDGES,
                 Reminder.last_nudge_at.isnot(None),
+                or_(User.silent_until.is_(None), User.silent_until < now_utc),
             )
         )
         result = await session.execute(stmt)
-        reminders = result.scalars().all()
-
-        for reminder in reminders:
-            user = await session.get(User, reminder.user_id)
-            if not user:
-                continue
 
+        sem = asyncio.Semaphore(_SEND_CONCURRENCY)
+        tasks = []
+        local_now_by_tz: dict[str, datetime] = {}
+        for reminder, user in result.all():
             # Check DND
-            tz = pytz.timezone(user.timezone or "Europe/Rome")
-            local_now = datetime.now(tz)
+            local_now = _local_now(now_utc, user.timezone, local_now_by_tz)
             if local_now.hour >= user.sleep_hour or local_now.hour < user.wake_hour:
                 continue
 
@@ -155,26 +188,12 @@ async def check_nudges():
                     text = nudge_3(reminder)       # last nudge
 
                 keyboard = _get_nudge_keyboard(reminder, reminder.nudge_count + 1)
+                tasks.append(_send_nudge_message(
+                    sem, reminder, user.id, text, keyboard, now_utc,
+                ))
 
-                try:
-                    await _bot.send_message(
-                        chat_id=user.chat_id,
-                        text=text,
-                        parse_mode="Markdown",
-                        reply_markup=keyboard,
-                    )
-                    reminder.nudge_count += 1
-                    reminder.last_nudge_at = now_utc
-                    # Track for contextual replies
-                    last_sent_reminders[reminder.user_id] = {
-                        "reminder_id": reminder.id,
-                        "title": reminder.title,
-                        "category": reminder.category,
-                        "sent_at": now_utc,
-                    }
-                    await session.commit()
-                except Exception as e:
-                    logger.error(f"Failed to send nudge for {reminder.id}: {e}")
+        if tasks and any(await asyncio.gather(*tasks)):
+            await session.commit()
 
 
 async def send_morning_summaries():
@@ -182,21 +201,31 @@ async def send_morning_summaries():
     if not _bot:
         return
 
+    # Every real UTC offset is a multiple of 15 minutes, so local minute 0
+    # can only occur on quarter-hour UTC ticks — skip the query otherwise.
+    now_utc = utcnow()
+    if now_utc.minute % 15:
+        return
+
     async with async_session() as session:
-        stmt = select(User).where(User.morning_summary == True)
+        stmt = select(User.id, User.timezone, User.wake_hour).where(
+            User.morning_summary == True
+        )
         result = await session.execute(stmt)
-        users = result.scalars().all()
+        users = result.all()
 
+        users_items: dict[int, list[dict]] = {}
+        local_now_by_tz: dict[str, datetime] = {}
         for user in users:
-            tz = pytz.timezone(user.timezone or "Europe/Rome")
-            local_now = datetime.now(tz)
+            local_now = _local_now(now_utc, user.timezone, local_now_by_tz)
+            tz = local_now.tzinfo
 
             # Only send at the exact wake hour, minute 0
             if local_now.hour != user.wake_hour or local_now.minute != 0:
                 continue
 
             # Get today's reminders
-            today_start = local_now.replace(hour=0, minute=0, second=0).astimezone(pytz.UTC).replace(tzinfo=None)
+            today_start = local_now.replace(hour=0, minute=0, second=0).astimezone(timezone.utc)
             today_end = today_start + timedelta(days=1)
 
             stmt2 = select(Reminder).where(
@@ -210,9 +239,6 @@ async def send_morning_summaries():
             result2 = await session.execute(stmt2)
             reminders = result2.scalars().all()
 
-            if not reminders and not user.morning_summary:
-                continue
-
             items = []
             seen_parents = set()
             for r in reminders:
@@ -223,9 +249,9 @@ async def send_morning_summaries():
                 item = {"title": r.title, "category": r.category}
 
                 if r.fire_times:
-                    item["times"] = r.fire_times.split(",")
+                    item["times"] = list(r.fire_times)
                 else:
-                    fire_local = pytz.UTC.localize(r.next_fire).astimezone(tz)
+                    fire_local = r.next_fire.astimezone(tz)
                     item["times"] = [fire_local.strftime("%H:%M")]
 
                 # Birthday special note
@@ -236,11 +262,23 @@ async def send_morning_summaries():
                 if r.id:
                     seen_parents.add(r.id)
 
-            text = morning_summary(items)
+            users_items[user.id] = items
+
+        # Render once per distinct schedule — users on identical recurring
+        # plans share the same summary text.
+        sem = asyncio.Semaphore(_SEND_CONCURRENCY)
+
+        async def _send_summary(user_id, text):
             try:
-                await _bot.send_message(chat_id=user.chat_id, text=text, parse_mode="Markdown")
+                async with sem:
+                    await _bot.send_message(chat_id=user_id, text=text, parse_mode="Markdown")
             except Exception as e:
-                logger.error(f"Failed morning summary for user {user.id}: {e}")
+                logger.error(f"Failed morning summary for user {user_id}: {e}")
+
+        await asyncio.gather(*(
+            _send_summary(uid, text)
+            for uid, text in morning_summary_many(users_items).items()
+        ))
 
 
 async def send_weekly_summaries():
@@ -248,14 +286,21 @@ async def send_weekly_summaries():
     if not _bot:
         return
 
+    # Local minute <= 4 implies UTC minute % 15 <= 4 (offsets are all
+    # quarter-hour multiples) — skip the full-table read otherwise.
+    now_utc = utcnow()
+    if now_utc.minute % 15 > 4:
+        return
+
     async with async_session() as session:
-        stmt = select(User)
+        stmt = select(User.id, User.timezone)
         result = await session.execute(stmt)
-        users = result.scalars().all()
+        users = result.all()
 
+        outgoing: list[tuple[int, str]] = []
+        local_now_by_tz: dict[str, datetime] = {}
         for user in users:
-            tz = pytz.timezone(user.timezone or "Europe/Rome")
-            local_now = datetime.now(tz)
+            local_now = _local_now(now_utc, user.timezone, local_now_by_tz)
 
             # Sunday at 20:00
             if local_now.weekday() != 6 or local_now.hour != 20 or local_now.minute > 4:
@@ -263,7 +308,7 @@ async def send_weekly_summaries():
 
             week_start = (local_now - timedelta(days=7)).replace(
                 hour=0, minute=0, second=0
-            ).astimezone(pytz.UTC).replace(tzinfo=None)
+            ).astimezone(timezone.utc)
 
             stmt2 = select(ReminderLog).where(
                 and_(
@@ -281,7 +326,7 @@ async def send_weekly_summaries():
             # Count medicine doses
             med_logs = [l for l in logs if l.action in ("done", "skipped")]
             # Simplified: count upcoming
-            next_week_end = datetime.utcnow() + timedelta(days=7)
+            next_week_end = now_utc + timedelta(days=7)
             stmt3 = select(Reminder).where(
                 and_(
                     Reminder.user_id == user.id,
@@ -292,27 +337,40 @@ async def send_weekly_summaries():
             result3 = await session.execute(stmt3)
             upcoming = len(result3.scalars().all())
 
-            text = weekly_summary(done, snoozed, cancelled, upcoming=upcoming)
+            outgoing.append((user.id, weekly_summary(done, snoozed, cancelled, upcoming=upcoming)))
+
+        # Sends gathered after the per-user queries: the session is done
+        # by then, so only Telegram I/O overlaps.
+        sem = asyncio.Semaphore(_SEND_CONCURRENCY)
+
+        async def _send_weekly(user_id, text):
             try:
-                await _bot.send_message(chat_id=user.chat_id, text=text, parse_mode="Markdown")
+                async with sem:
+                    await _bot.send_message(chat_id=user_id, text=text, parse_mode="Markdown")
             except Exception as e:
-                logger.error(f"Failed weekly summary for user {user.id}: {e}")
+                logger.error(f"Failed weekly summary for user {user_id}: {e}")
+
+        await asyncio.gather(*(_send_weekly(uid, text) for uid, text in outgoing))
+
 
+async def reschedule_reminder(reminder: Reminder, session, user: User | None = None):
+    """Calculate and set the next fire time for recurring reminders.
 
-async def reschedule_reminder(reminder: Reminder, session):
-    """Calculate and set the next fire time for recurring reminders."""
+    Pass the already-loaded ``user`` where available; otherwise it is
+    looked up on the caller's session (an identity-map hit when the user
+    was touched earlier in the same transaction), never on a second
+    connection checkout.
+    """
     if reminder.recurrence == RecurrenceType.ONCE:
         reminder.status = ReminderStatus.DONE
         return
 
-    tz_name = "Europe/Rome"
-    async with async_session() as s2:
-        user = await s2.get(User, reminder.user_id)
-        if user:
-            tz_name = user.timezone or "Europe/Rome"
+    if user is None:
+        user = await session.get(User, reminder.user_id)
+    tz_name = (user.timezone if user else None) or "Europe/Rome"
 
-    tz = pytz.timezone(tz_name)
-    current = pytz.UTC.localize(reminder.next_fire).astimezone(tz)
+    tz = ZoneInfo(tz_name)
+    current = reminder.next_fire.astimezone(tz)
 
     if reminder.recurrence == RecurrenceType.DAILY:
         next_dt = current + timedelta(days=1)
@@ -334,96 +392,80 @@ async def reschedule_reminder(reminder: Reminder, session):
         next_dt = current + timedelta(days=1)
 
     # Check end date
-    if reminder.end_date and next_dt.astimezone(pytz.UTC).replace(tzinfo=None) > reminder.end_date:
+    if reminder.end_date and next_dt.astimezone(timezone.utc) > reminder.end_date:
         reminder.status = ReminderStatus.DONE
         return
 
-    reminder.next_fire = next_dt.astimezone(pytz.UTC).replace(tzinfo=None)
+    reminder.next_fire = next_dt.astimezone(timezone.utc)
     reminder.nudge_count = 0
     reminder.last_nudge_at = None
 
 
-def _get_reminder_keyboard(reminder: Reminder):
-    """Get inline keyboard for a reminder notification."""
+# Keyboard layouts keyed by (is_medicine, stage): only the reminder id
+# varies per send, so the label/action structure lives in one static
+# table and the dispatch if/elif trees collapse into a lookup plus a
+# single comprehension. Stage 1 doubles for nudge 2 (same keyboard).
+_KB_LAYOUTS = {
+    (True, 1): ((("✅ Presa", "done"), ("⏰ Tra 30min", "snooze30")),),
+    (False, 1): (
+        (("✅ Fatto!", "done"), ("⏰ Tra 1h", "snooze60")),
+        (("⏰ Domani", "tomorrow"), ("❌ Cancella", "cancel")),
+    ),
+    (True, 3): ((("✅ Presa", "done"), ("⏰ Tra 30min", "snooze30"),
+                 ("⏭ Salta oggi", "skip")),),
+    (False, 3): ((("✅ Fatto!", "done"), ("⏰ Tra 1h", "snooze60"),
+                  ("⏰ Domani", "tomorrow")),),
+    (True, 4): ((("✅ Presa ora", "done"), ("⏭ Saltata", "skip")),),
+    (False, 4): ((("✅ Già fatto", "done"), ("📅 Domani", "tomorrow"),
+                  ("🗑 Lascia perdere", "cancel")),),
+}
+
+
+def _build_keyboard(is_medicine: bool, stage: int, rid: int):
     from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
-    rid = reminder.id
-    if reminder.category == ReminderCategory.MEDICINE:
-        return InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("✅ Presa", callback_data=f"done:{rid}"),
-                InlineKeyboardButton("⏰ Tra 30min", callback_data=f"snooze30:{rid}"),
-            ]
-        ])
-
     return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("✅ Fatto!", callback_data=f"done:{rid}"),
-            InlineKeyboardButton("⏰ Tra 1h", callback_data=f"snooze60:{rid}"),
-        ],
-        [
-            InlineKeyboardButton("⏰ Domani", callback_data=f"tomorrow:{rid}"),
-            InlineKeyboardButton("❌ Cancella", callback_data=f"cancel:{rid}"),
-        ],
+        [InlineKeyboardButton(label, callback_data=f"{action}:{rid}") for label, action in row]
+        for row in _KB_LAYOUTS[(is_medicine, stage)]
     ])
 
 
+def _get_reminder_keyboard(reminder: Reminder):
+    """Get inline keyboard for a reminder notification."""
+    return _build_keyboard(
+        reminder.category == ReminderCategory.MEDICINE, 1, reminder.id
+    )
+
+
 def _get_nudge_keyboard(reminder: Reminder, nudge_num: int):
     """Get keyboard for follow-up nudges."""
-    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    stage = 1 if nudge_num == 2 else nudge_num if nudge_num == 3 else 4
+    return _build_keyboard(
+        reminder.category == ReminderCategory.MEDICINE, stage, reminder.id
+    )
+
+
+async def complete_latest_nudged(session, user_id: int) -> Reminder | None:
+    """Mark the most recently nudged active reminder as done.
+
+    Shared by /fatto and the quick-confirm text path, which used to run
+    the identical query separately. Logs the action, reschedules and
+    commits, so both callers share one transaction boundary. Returns the
+    completed reminder, or None if nothing was pending.
+    """
+    stmt = select(Reminder).where(
+        and_(
+            Reminder.user_id == user_id,
+            Reminder.status == ReminderStatus.ACTIVE,
+            Reminder.nudge_count > 0,
+        )
+    ).order_by(Reminder.last_nudge_at.desc()).limit(1)
+    reminder = (await session.execute(stmt)).scalar_one_or_none()
 
-    rid = reminder.id
-
-    # Nudge 2 = quick 5-min followup (same keyboard as original)
-    if nudge_num == 2:
-        if reminder.category == ReminderCategory.MEDICINE:
-            return InlineKeyboardMarkup([
-                [
-                    InlineKeyboardButton("✅ Presa", callback_data=f"done:{rid}"),
-                    InlineKeyboardButton("⏰ Tra 30min", callback_data=f"snooze30:{rid}"),
-                ]
-            ])
-        return InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("✅ Fatto!", callback_data=f"done:{rid}"),
-                InlineKeyboardButton("⏰ Tra 1h", callback_data=f"snooze60:{rid}"),
-            ],
-            [
-                InlineKeyboardButton("⏰ Domani", callback_data=f"tomorrow:{rid}"),
-                InlineKeyboardButton("❌ Cancella", callback_data=f"cancel:{rid}"),
-            ],
-        ])
-
-    # Nudge 3 = 30-min nudge (more options)
-    if nudge_num == 3:
-        if reminder.category == ReminderCategory.MEDICINE:
-            return InlineKeyboardMarkup([
-                [
-                    InlineKeyboardButton("✅ Presa", callback_data=f"done:{rid}"),
-                    InlineKeyboardButton("⏰ Tra 30min", callback_data=f"snooze30:{rid}"),
-                    InlineKeyboardButton("⏭ Salta oggi", callback_data=f"skip:{rid}"),
-                ]
-            ])
-        return InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("✅ Fatto!", callback_data=f"done:{rid}"),
-                InlineKeyboardButton("⏰ Tra 1h", callback_data=f"snooze60:{rid}"),
-                InlineKeyboardButton("⏰ Domani", callback_data=f"tomorrow:{rid}"),
-            ]
-        ])
-
-    # Nudge 4 (last)
-    if reminder.category == ReminderCategory.MEDICINE:
-        return InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("✅ Presa ora", callback_data=f"done:{rid}"),
-                InlineKeyboardButton("⏭ Saltata", callback_data=f"skip:{rid}"),
-            ]
-        ])
-    return InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("✅ Già fatto", callback_data=f"done:{rid}"),
-            InlineKeyboardButton("📅 Domani", callback_data=f"tomorrow:{rid}"),
-            InlineKeyboardButton("🗑 Lascia perdere", callback_data=f"cancel:{rid}"),
-        ]
-    ])
+    if not reminder:
+        return None
+
+    session.add(ReminderLog(user_id=user_id, reminder_id=reminder.id, action="done"))
+    await reschedule_reminder(reminder, session)
+    await session.commit()
+    return reminder
@@ -18,7 +18,7 @@ import hmac
 import json
 import logging
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 from urllib.parse import unquote, parse_qs
 
@@ -29,7 +29,7 @@ from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from sqlalchemy import select, and_, func, extract
 from sqlalchemy.ext.asyncio import AsyncSession
-import pytz
+from zoneinfo import ZoneInfo
 
 from database import (
     async_session, Reminder, ReminderLog, User,
@@ -227,15 +227,15 @@ class StatsOut(BaseModel):
 # Helpers
 # ─────────────────────────────────────────────
 
-async def _get_user_tz(user_id: int) -> pytz.BaseTzInfo:
+async def _get_user_tz(user_id: int) -> ZoneInfo:
     async with async_session() as session:
         user = await session.get(User, user_id)
         tz_name = user.timezone if user else "Europe/Rome"
-    return pytz.timezone(tz_name)
+    return ZoneInfo(tz_name)
 
 
 def _reminder_to_out(r: Reminder, tz) -> ReminderOut:
-    fire_local = pytz.UTC.localize(r.next_fire).astimezone(tz)
+    fire_local = r.next_fire.astimezone(tz)
     return ReminderOut(
         id=r.id,
         title=r.title,
@@ -245,7 +245,8 @@ def _reminder_to_out(r: Reminder, tz) -> ReminderOut:
         next_fire_time=fire_local.strftime("%H:%M"),
         recurrence=r.recurrence or "once",
         recurrence_days=r.recurrence_days,
-        fire_times=r.fire_times,
+        # The frontend expects the legacy comma-joined string
+        fire_times=",".join(r.fire_times) if r.fire_times else None,
         status=r.status or "active",
         nudge_count=r.nudge_count or 0,
         snooze_count=r.snooze_count or 0,
@@ -281,8 +282,8 @@ async def list_reminders(
         start = now.replace(hour=0, minute=0, second=0) - timedelta(days=1)
         end = start + timedelta(days=365)
 
-    start_utc = start.astimezone(pytz.UTC).replace(tzinfo=None)
-    end_utc = end.astimezone(pytz.UTC).replace(tzinfo=None)
+    start_utc = start.astimezone(timezone.utc)
+    end_utc = end.astimezone(timezone.utc)
 
     async with async_session() as session:
         conditions = [
@@ -321,8 +322,8 @@ async def create_reminder(
     try:
         fire_date = datetime.strptime(data.date, "%Y-%m-%d")
         parts = data.time.split(":")
-        fire_dt = tz.localize(fire_date.replace(hour=int(parts[0]), minute=int(parts[1]), second=0))
-        fire_utc = fire_dt.astimezone(pytz.UTC).replace(tzinfo=None)
+        fire_dt = fire_date.replace(hour=int(parts[0]), minute=int(parts[1]), second=0, tzinfo=tz)
+        fire_utc = fire_dt.astimezone(timezone.utc)
     except (ValueError, IndexError):
         raise HTTPException(status_code=400, detail="Invalid date/time format")
 
@@ -330,25 +331,23 @@ async def create_reminder(
     if data.end_date:
         try:
             ed = datetime.strptime(data.end_date, "%Y-%m-%d")
-            end_date = tz.localize(ed).astimezone(pytz.UTC).replace(tzinfo=None)
+            end_date = ed.replace(tzinfo=tz).astimezone(timezone.utc)
         except ValueError:
             pass
 
     async with async_session() as session:
-        fire_times_str = ",".join(data.fire_times) if data.fire_times else None
-
         if data.fire_times and len(data.fire_times) > 1:
             # Multi-time: create one reminder per time slot
             for idx, t in enumerate(data.fire_times):
                 h, m = map(int, t.split(":"))
-                slot_dt = tz.localize(fire_date.replace(hour=h, minute=m, second=0))
-                slot_utc = slot_dt.astimezone(pytz.UTC).replace(tzinfo=None)
+                slot_dt = fire_date.replace(hour=h, minute=m, second=0, tzinfo=tz)
+                slot_utc = slot_dt.astimezone(timezone.utc)
 
                 r = Reminder(
                     user_id=user_id, title=data.title, category=data.category,
                     next_fire=slot_utc, recurrence=data.recurrence,
                     recurrence_days=data.recurrence_days,
-                    fire_times=fire_times_str, end_date=end_date,
+                    fire_times=data.fire_times, end_date=end_date,
                     time_slot_index=idx, time_slot_total=len(data.fire_times),
                 )
                 session.add(r)
@@ -357,7 +356,7 @@ async def create_reminder(
                 user_id=user_id, title=data.title, category=data.category,
                 next_fire=fire_utc, recurrence=data.recurrence,
                 recurrence_days=data.recurrence_days,
-                fire_times=fire_times_str, end_date=end_date,
+                fire_times=data.fire_times, end_date=end_date,
             )
             session.add(r)
 
@@ -387,7 +386,7 @@ async def update_reminder(
             r.category = data.category
 
         if data.date or data.time:
-            old_fire = pytz.UTC.localize(r.next_fire).astimezone(tz)
+            old_fire = r.next_fire.astimezone(tz)
             new_dt = old_fire
             if data.date:
                 d = datetime.strptime(data.date, "%Y-%m-%d")
@@ -395,7 +394,7 @@ async def update_reminder(
             if data.time:
                 parts = data.time.split(":")
                 new_dt = new_dt.replace(hour=int(parts[0]), minute=int(parts[1]))
-            r.next_fire = new_dt.astimezone(pytz.UTC).replace(tzinfo=None)
+            r.next_fire = new_dt.astimezone(timezone.utc)
 
         await session.commit()
         return {"ok": True, "reminder": _reminder_to_out(r, tz)}
@@ -455,14 +454,14 @@ async def calendar_month(
     user_id = user["id"]
     tz = await _get_user_tz(user_id)
 
-    start = tz.localize(datetime(year, month, 1))
+    start = datetime(year, month, 1, tzinfo=tz)
     if month == 12:
-        end = tz.localize(datetime(year + 1, 1, 1))
+        end = datetime(year + 1, 1, 1, tzinfo=tz)
     else:
-        end = tz.localize(datetime(year, month + 1, 1))
+        end = datetime(year, month + 1, 1, tzinfo=tz)
 
-    start_utc = start.astimezone(pytz.UTC).replace(tzinfo=None)
-    end_utc = end.astimezone(pytz.UTC).replace(tzinfo=None)
+    start_utc = start.astimezone(timezone.utc)
+    end_utc = end.astimezone(timezone.utc)
 
     async with async_session() as session:
         stmt = select(Reminder).where(
@@ -481,7 +480,7 @@ async def calendar_month(
     for r in reminders:
         if r.time_slot_index and r.time_slot_index > 0:
             continue
-        fire_local = pytz.UTC.localize(r.next_fire).astimezone(tz)
+        fire_local = r.next_fire.astimezone(tz)
         day_key = fire_local.day
         if day_key not in days:
             days[day_key] = []
@@ -505,7 +504,7 @@ async def get_stats(user: dict = Depends(get_current_user)):
         total_active = (await session.execute(stmt)).scalar() or 0
 
         # Completed today
-        today_start = now.replace(hour=0, minute=0, second=0).astimezone(pytz.UTC).replace(tzinfo=None)
+        today_start = now.replace(hour=0, minute=0, second=0).astimezone(timezone.utc)
         stmt = select(func.count()).where(
             and_(
                 ReminderLog.user_id == user_id,
@@ -518,7 +517,7 @@ async def get_stats(user: dict = Depends(get_current_user)):
         # Completed this week
         week_start = (now - timedelta(days=now.weekday())).replace(
             hour=0, minute=0, second=0
-        ).astimezone(pytz.UTC).replace(tzinfo=None)
+        ).astimezone(timezone.utc)
         stmt = select(func.count()).where(
             and_(
                 ReminderLog.user_id == user_id,
@@ -543,7 +542,7 @@ async def get_stats(user: dict = Depends(get_current_user)):
         streak = 0
         check_date = now.replace(hour=0, minute=0, second=0)
         for i in range(60):  # Max 60 day streak
-            day_start = (check_date - timedelta(days=i)).astimezone(pytz.UTC).replace(tzinfo=None)
+            day_start = (check_date - timedelta(days=i)).astimezone(timezone.utc)
             day_end = day_start + timedelta(days=1)
             stmt = select(func.count()).where(
                 and_(